@@ -0,0 +1,82 @@
+"""
+On-disk memoization of results derived from a source file.
+
+Entries are keyed by (path, st_mtime_ns, st_size) of the source, so a
+rewritten file simply misses the cache; stale entries for the same source
+and tag are removed when a fresh one is written.
+"""
+
+import glob
+import hashlib
+import os
+from typing import Any, Callable, Dict, Optional
+
+import numpy as np
+
+from api import _json
+
+
+def _entry_path(cache_dir: str, filepath: str, tag: str, ext: str) -> Optional[str]:
+    try:
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        return None
+    source = hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest()[:16]
+    version = hashlib.sha1(f'{st.st_mtime_ns}:{st.st_size}'.encode()).hexdigest()[:16]
+    return os.path.join(cache_dir, f'{source}-{tag}-{version}{ext}')
+
+
+def _store(path: str, write: Callable[[Any], None]) -> None:
+    """Atomically write a cache entry and drop older versions of it."""
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    prefix, ext = os.path.basename(path).rsplit('-', 1)[0], os.path.splitext(path)[1]
+    for stale in glob.glob(os.path.join(glob.escape(directory), f'{prefix}-*{ext}')):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+def memoize_json(filepath: str, tag: str, compute_fn: Callable[[], Dict[str, Any]],
+                 cache_dir: str) -> Dict[str, Any]:
+    """Return compute_fn()'s JSON-serializable result, cached per version of filepath."""
+    path = _entry_path(cache_dir, filepath, tag, '.json')
+    if path is None:
+        return compute_fn()
+    try:
+        with open(path, 'rb') as f:
+            return _json.loads(f.read())
+    except (OSError, _json.JSONDecodeError):
+        pass
+
+    result = compute_fn()
+    try:
+        _store(path, lambda f: f.write(_json.dumps(result)))
+    except OSError:
+        pass
+    return result
+
+
+def memoize_array(filepath: str, tag: str, compute_fn: Callable[[], np.ndarray],
+                  cache_dir: str) -> np.ndarray:
+    """Return compute_fn()'s ndarray result, cached as .npy per version of filepath."""
+    path = _entry_path(cache_dir, filepath, tag, '.npy')
+    if path is None:
+        return compute_fn()
+    try:
+        return np.load(path, allow_pickle=False)
+    except (OSError, ValueError):
+        pass
+
+    result = compute_fn()
+    try:
+        _store(path, lambda f: np.save(f, result, allow_pickle=False))
+    except OSError:
+        pass
+    return result
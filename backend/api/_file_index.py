@@ -0,0 +1,85 @@
+"""
+SQLite index of uploaded files, keyed by file_id.
+
+Lets /train, /analyze and /delete resolve a file_id without scanning the
+upload directory. The database lives next to the uploads and runs in WAL
+mode so concurrent readers do not block the writer; each thread reuses one
+connection per app context via flask.g. The schema is set up once per
+database per process.
+"""
+
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+from flask import g
+
+INDEX_FILENAME = '.file_index.sqlite3'
+
+# Databases whose schema this process has already set up
+_initialized = set()
+_init_lock = threading.Lock()
+
+
+def _init_schema(conn: sqlite3.Connection, db_path: str) -> None:
+    with _init_lock:
+        if db_path in _initialized:
+            return
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute(
+            'CREATE TABLE IF NOT EXISTS files ('
+            'file_id TEXT PRIMARY KEY, path TEXT NOT NULL, size INTEGER, mtime REAL)'
+        )
+        _initialized.add(db_path)
+
+
+def _connect(upload_dir: str) -> sqlite3.Connection:
+    conns = g.setdefault('_file_index_conns', {})
+    conn = conns.get(upload_dir)
+    if conn is None:
+        db_path = os.path.abspath(os.path.join(upload_dir, INDEX_FILENAME))
+        if not os.path.exists(db_path):
+            _initialized.discard(db_path)  # e.g. the upload directory was wiped
+        conn = sqlite3.connect(db_path)
+        if db_path not in _initialized:
+            _init_schema(conn, db_path)
+        conns[upload_dir] = conn
+    return conn
+
+
+def close_connections(exc: Optional[BaseException] = None) -> None:
+    """Close this app context's index connections (registered as a teardown hook)."""
+    for conn in g.pop('_file_index_conns', {}).values():
+        conn.close()
+
+
+def add_file(upload_dir: str, file_id: str, path: str) -> None:
+    """Record an uploaded file."""
+    st = os.stat(path)
+    conn = _connect(upload_dir)
+    with conn:
+        conn.execute(
+            'INSERT OR REPLACE INTO files (file_id, path, size, mtime) VALUES (?, ?, ?, ?)',
+            (file_id, os.path.abspath(path), st.st_size, st.st_mtime)
+        )
+
+
+def remove_file(upload_dir: str, file_id: str) -> None:
+    """Forget an uploaded file."""
+    conn = _connect(upload_dir)
+    with conn:
+        conn.execute('DELETE FROM files WHERE file_id = ?', (file_id,))
+
+
+def lookup_file(upload_dir: str, file_id: str) -> Optional[str]:
+    """Return the indexed path for file_id, or None (stale rows are dropped)."""
+    row = _connect(upload_dir).execute(
+        'SELECT path FROM files WHERE file_id = ?', (file_id,)
+    ).fetchone()
+    if row is None:
+        return None
+    if not os.path.exists(row[0]):
+        remove_file(upload_dir, file_id)
+        return None
+    return row[0]
@@ -0,0 +1,94 @@
+"""
+On-disk registry of background /train and /analyze jobs.
+
+Each job is one JSON file named after its job_id and rewritten atomically on
+every state change, so a status poll can be answered by any server process
+and jobs survive a worker restart. A job still marked queued/running whose
+owning process has exited is reported as finished with a 500 result.
+"""
+
+import os
+import re
+import threading
+import time
+from typing import Any, Dict, Optional
+
+from api import _json
+
+# Finished jobs beyond this many are removed oldest-first
+MAX_JOBS = 100
+
+_JOB_ID_RE = re.compile(r'[0-9a-f]{32}\Z')
+
+
+def _job_path(jobs_dir: str, job_id: str) -> str:
+    return os.path.join(jobs_dir, f'{job_id}.json')
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def write_job(jobs_dir: str, job_id: str, status: str, **fields: Any) -> None:
+    """Record the current state of a job (owned by this process)."""
+    os.makedirs(jobs_dir, exist_ok=True)
+    record = {
+        'job_id': job_id,
+        'status': status,
+        'pid': os.getpid(),
+        'updated_at': time.time(),
+        **fields,
+    }
+    path = _job_path(jobs_dir, job_id)
+    tmp_path = f'{path}.{os.getpid()}.{threading.get_ident()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(_json.dumps(record))
+    os.replace(tmp_path, path)
+
+
+def read_job(jobs_dir: str, job_id: str) -> Optional[Dict[str, Any]]:
+    """Return the job's record, or None if there is no such job."""
+    if not _JOB_ID_RE.match(job_id):
+        return None
+    try:
+        with open(_job_path(jobs_dir, job_id), 'rb') as f:
+            record = _json.loads(f.read())
+    except (OSError, _json.JSONDecodeError):
+        return None
+
+    pid = record.get('pid')
+    if record.get('status') != 'finished' and not (isinstance(pid, int) and pid > 0 and _pid_alive(pid)):
+        record.update({
+            'status': 'finished',
+            'result': {'success': False, 'error': 'Job was lost: the server process running it exited'},
+            'result_status': 500,
+        })
+    return record
+
+
+def prune_jobs(jobs_dir: str, keep: int = MAX_JOBS) -> None:
+    """Remove the oldest finished jobs so at most ``keep`` job files remain."""
+    try:
+        with os.scandir(jobs_dir) as it:
+            entries = [(e.stat().st_mtime, e.name[:-len('.json')])
+                       for e in it if e.name.endswith('.json')]
+    except OSError:
+        return
+
+    excess = len(entries) - keep
+    for _, job_id in sorted(entries):
+        if excess <= 0:
+            break
+        record = read_job(jobs_dir, job_id)
+        if record is not None and record['status'] == 'finished':
+            try:
+                os.remove(_job_path(jobs_dir, job_id))
+                excess -= 1
+            except OSError:
+                pass
@@ -0,0 +1,102 @@
+"""
+JSON codec used by the API: orjson when available, then ujson, then stdlib.
+
+All backends expose the same surface:
+    dumps(obj, indent=False) -> bytes   (compact unless indent=True)
+    dumps_line(obj) -> bytes            (dumps plus a trailing newline, for JSONL)
+    loads(data) -> object               (accepts str or bytes)
+    JSONDecodeError                     (raised by loads on malformed input)
+
+count_jsonl_lines(path) counts JSONL records without decoding them.
+
+Naive datetimes are treated as UTC and written as ISO 8601 with a 'Z'
+suffix; numpy scalars and arrays are written as plain numbers/lists.
+"""
+
+from datetime import datetime
+from typing import Any
+
+try:
+    import orjson
+
+    BACKEND = 'orjson'
+    JSONDecodeError = orjson.JSONDecodeError
+    loads = orjson.loads
+
+    _OPTIONS = (
+        orjson.OPT_NAIVE_UTC | orjson.OPT_UTC_Z
+        | orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS
+    )
+
+    def dumps(obj: Any, indent: bool = False) -> bytes:
+        return orjson.dumps(obj, option=(_OPTIONS | orjson.OPT_INDENT_2) if indent else _OPTIONS)
+
+    def dumps_line(obj: Any) -> bytes:
+        return orjson.dumps(obj, option=_OPTIONS | orjson.OPT_APPEND_NEWLINE)
+
+except ImportError:
+    import numpy as np
+
+    def _default(obj: Any) -> Any:
+        if isinstance(obj, datetime):
+            if obj.tzinfo is None:
+                return obj.isoformat() + 'Z'
+            return obj.isoformat().replace('+00:00', 'Z')
+        if isinstance(obj, np.ndarray):
+            return obj.tolist()
+        if isinstance(obj, np.generic):
+            return obj.item()
+        raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+    try:
+        import ujson
+
+        BACKEND = 'ujson'
+        JSONDecodeError = getattr(ujson, 'JSONDecodeError', ValueError)
+        loads = ujson.loads
+
+        def dumps(obj: Any, indent: bool = False) -> bytes:
+            return ujson.dumps(
+                obj, default=_default, ensure_ascii=False, indent=2 if indent else 0
+            ).encode()
+
+    except ImportError:
+        import json
+
+        BACKEND = 'json'
+        JSONDecodeError = json.JSONDecodeError
+        loads = json.loads
+
+        def dumps(obj: Any, indent: bool = False) -> bytes:
+            if indent:
+                return json.dumps(obj, default=_default, ensure_ascii=False, indent=2).encode()
+            return json.dumps(
+                obj, default=_default, ensure_ascii=False, separators=(',', ':')
+            ).encode()
+
+    def dumps_line(obj: Any) -> bytes:
+        return dumps(obj) + b'\n'
+
+
+COUNT_CHUNK_BYTES = 1024 * 1024
+
+
+def count_jsonl_lines(filepath: str) -> int:
+    """
+    Count the lines of a JSONL file without decoding it.
+    
+    Blank or malformed lines are counted too, so this is an upper bound on
+    the number of records -- enough to reject files that are too small
+    before paying for a full parse. Missing files count as 0.
+    """
+    count = 0
+    last = b'\n'
+    try:
+        with open(filepath, 'rb') as f:
+            # bytes.count is a memchr-style scan in C; 1 MiB reads bound memory
+            for chunk in iter(lambda: f.read(COUNT_CHUNK_BYTES), b''):
+                count += chunk.count(b'\n')
+                last = chunk[-1:]
+    except FileNotFoundError:
+        return 0
+    return count + (last != b'\n')
@@ -19,15 +19,18 @@ Usage:
 
     Production (Live capture):
     PYTHONPATH=. python api/api_server.py --mode live --interface eth0
+    
+    Production server (gunicorn, one worker per CPU):
+    PYTHONPATH=. python api/api_server.py --mode pcap --pcap <file> --serve-prod
 """
 
 import argparse
-import json
 import os
 import sys
+import time
 from datetime import datetime
 from typing import Dict, Any, Tuple
-from flask import Flask, jsonify, request
+from flask import Flask, current_app, g, has_app_context, request
 from pathlib import Path
 
 # Add backend to path
@@ -35,9 +38,20 @@ sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')
 
 import logging
 from app.main import setup_logging
+from api._io import init_io_pool, io_map
+from api.responses import AVAILABILITY_CACHE_KEY, cached_response, ojsonify, request_time
 
 api_logger = logging.getLogger('api')
 
+# Seconds a get_data_availability result is reused before re-stat'ing
+AVAILABILITY_TTL = 2.0
+
+# Seconds the serialized /health and /api/status payloads are reused. Cache
+# invalidation only reaches the worker that wrote the data, so /api/status
+# must not outlive the availability check it embeds
+HEALTH_CACHE_TTL = 1.0
+STATUS_CACHE_TTL = AVAILABILITY_TTL
+
 
 class APIConfig:
     """Configuration for the API server."""
@@ -63,9 +77,9 @@ class APIConfig:
     PCAP_FILE = 'backend/data/raw/pcapng/test_net_traffic.pcapng'
     INTERFACE = None
     
-    # API response settings
-    JSON_SORT_KEYS = True
-    JSONIFY_PRETTYPRINT_REGULAR = True
+    # API response settings (compact output; pass ?pretty=1 for indented JSON)
+    JSON_SORT_KEYS = False
+    JSONIFY_PRETTYPRINT_REGULAR = False
 
 
 def create_app(config: Dict[str, Any]) -> Flask:
@@ -86,6 +100,12 @@ def create_app(config: Dict[str, Any]) -> Flask:
         if hasattr(APIConfig, key):
             app.config[key] = value
     
+    # Flask 2.3+ reads these from the JSON provider rather than app.config
+    app.json.sort_keys = app.config['JSON_SORT_KEYS']
+    app.json.compact = not app.config['JSONIFY_PRETTYPRINT_REGULAR']
+    
+    init_io_pool(app)
+    
     # Setup logging
     setup_logging()
     api_logger.info(f"API starting in {config.get('MODE')} mode")
@@ -94,6 +114,10 @@ def create_app(config: Dict[str, Any]) -> Flask:
     app.analyzer_config = config
     
     # Add request/response logging middleware
+    @app.before_request
+    def stamp_request():
+        g.req_time = datetime.utcnow()
+    
     @app.before_request
     def log_request():
         api_logger.info(f"→ {request.method} {request.path} from {request.remote_addr}")
@@ -113,21 +137,21 @@ def create_app(config: Dict[str, Any]) -> Flask:
     @app.route('/health', methods=['GET'])
     def health():
         api_logger.info("Health check requested")
-        return jsonify({
+        return cached_response('health', lambda: {
             'status': 'ok',
-            'timestamp': datetime.utcnow().isoformat(),
+            'timestamp': request_time(),
             'mode': app.config.get('MODE'),
             'version': '1.0.0'
-        }), 200
+        }, ttl=HEALTH_CACHE_TTL)
     
     @app.route('/api/status', methods=['GET'])
     def api_status():
         """Get API and system status."""
-        return jsonify({
+        return cached_response('api_status', lambda: {
             'api': {
                 'status': 'running',
                 'version': '1.0.0',
-                'timestamp': datetime.utcnow().isoformat()
+                'timestamp': request_time()
             },
             'system': {
                 'mode': app.config.get('MODE'),
@@ -138,7 +162,7 @@ def create_app(config: Dict[str, Any]) -> Flask:
                 'baselines_dir': app.config.get('BASELINES_DIR')
             },
             'data': get_data_availability(app.config)
-        }), 200
+        }, ttl=STATUS_CACHE_TTL)
     
     return app
 
@@ -161,71 +185,106 @@ def register_error_handlers(app: Flask) -> None:
     
     @app.errorhandler(400)
     def bad_request(error):
-        return jsonify({
+        return ojsonify({
             'error': 'Bad Request',
             'message': str(error),
-            'timestamp': datetime.utcnow().isoformat()
-        }), 400
+            'timestamp': request_time()
+        }, 400)
     
     @app.errorhandler(404)
     def not_found(error):
-        return jsonify({
+        return ojsonify({
             'error': 'Not Found',
             'message': 'The requested endpoint does not exist',
-            'timestamp': datetime.utcnow().isoformat()
-        }), 404
+            'timestamp': request_time()
+        }, 404)
     
     @app.errorhandler(500)
     def server_error(error):
-        return jsonify({
+        return ojsonify({
             'error': 'Internal Server Error',
             'message': str(error),
-            'timestamp': datetime.utcnow().isoformat()
-        }), 500
+            'timestamp': request_time()
+        }, 500)
     
     @app.errorhandler(ValueError)
     def value_error(error):
-        return jsonify({
+        return ojsonify({
             'error': 'Validation Error',
             'message': str(error),
-            'timestamp': datetime.utcnow().isoformat()
-        }), 400
+            'timestamp': request_time()
+        }, 400)
 
 
 def get_data_availability(config: Dict[str, Any]) -> Dict[str, Any]:
-    """Check what data/baselines are available."""
+    """Check what data/baselines are available (memoized for AVAILABILITY_TTL)."""
     metrics_dir = config.get('METRICS_DIR', 'logs')
     baselines_dir = config.get('BASELINES_DIR', 'app/baselines')
     
+    cache = current_app.extensions.setdefault(AVAILABILITY_CACHE_KEY, {}) if has_app_context() else {}
+    key = (metrics_dir, baselines_dir)
+    now = time.monotonic()
+    cached = cache.get(key)
+    if cached is not None and now - cached[0] < AVAILABILITY_TTL:
+        return cached[1]
+    
     availability = {
         'metrics': False,
         'baselines': False,
         'anomalies': False
     }
     
-    # Check for metrics file
-    metrics_file = os.path.join(metrics_dir, 'metrics.jsonl')
-    if os.path.exists(metrics_file):
-        availability['metrics'] = True
-    
-    # Check for baselines
+    # Stat every file on the I/O pool so the checks overlap
     baseline_files = [
         'baseline_bandwidth.json',
         'baseline_latency.json',
         'baseline_protocols.json',
         'baseline_connections.json'
     ]
-    if all(os.path.exists(os.path.join(baselines_dir, f)) for f in baseline_files):
-        availability['baselines'] = True
+    paths = [
+        os.path.join(metrics_dir, 'metrics.jsonl'),
+        os.path.join(metrics_dir, 'anomalies.jsonl'),
+        *(os.path.join(baselines_dir, f) for f in baseline_files)
+    ]
+    metrics_exists, anomalies_exists, *baselines_exist = io_map(os.path.exists, paths)
     
-    # Check for anomalies file
-    anomalies_file = os.path.join(metrics_dir, 'anomalies.jsonl')
-    if os.path.exists(anomalies_file):
-        availability['anomalies'] = True
+    availability['metrics'] = metrics_exists
+    availability['baselines'] = all(baselines_exist)
+    availability['anomalies'] = anomalies_exists
     
+    cache[key] = (now, availability)
     return availability
 
 
+def serve_prod(config: Dict[str, Any]) -> None:
+    """Replace this process with gunicorn serving api.wsgi:application."""
+    env = os.environ
+    env['API_MODE'] = config['MODE']
+    env['API_PCAP_FILE'] = config['PCAP_FILE'] or ''
+    env['API_INTERFACE'] = config['INTERFACE'] or ''
+    env['API_WINDOW_SIZE'] = str(config['WINDOW_SIZE'])
+    env['API_HOST'] = config['HOST']
+    env['API_PORT'] = str(config['PORT'])
+    
+    # Keep the current working directory (config paths are relative to it)
+    # and make the api package importable from it
+    backend_dir = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+    env['PYTHONPATH'] = os.pathsep.join(filter(None, [backend_dir, env.get('PYTHONPATH')]))
+    bind = f"{config['HOST']}:{config['PORT']}"
+    # Live-capture state (routes_control) lives in module globals, so start,
+    # stop and status must all reach the same process: one worker in live mode
+    workers = 1 if config['MODE'] == 'live' else (os.cpu_count() or 1)
+    print(f"Starting gunicorn on {bind} ({workers} workers)")
+    os.execvp('gunicorn', [
+        'gunicorn',
+        '-w', str(workers),
+        '-k', 'gthread',
+        '--threads', '4',
+        '-b', bind,
+        'api.wsgi:application',
+    ])
+
+
 def main():
     """Main entry point."""
     parser = argparse.ArgumentParser(
@@ -269,6 +328,11 @@ def main():
         action='store_true',
         help='Enable debug mode'
     )
+    parser.add_argument(
+        '--serve-prod',
+        action='store_true',
+        help='Serve with gunicorn (one worker per CPU) instead of the Flask dev server'
+    )
     
     args = parser.parse_args()
     
@@ -289,6 +353,9 @@ def main():
         'PORT': args.port,
     }
     
+    if args.serve_prod:
+        serve_prod(config)
+    
     # Create and run app
     app = create_app(config)
     
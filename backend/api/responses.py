@@ -0,0 +1,77 @@
+"""
+Shared JSON response helpers for the API blueprints.
+"""
+
+import hashlib
+import time
+from datetime import datetime
+from typing import Any, Callable
+
+from flask import current_app, g, has_app_context, request
+
+from api import _json
+
+# app.extensions slot for api_server.get_data_availability's memo
+AVAILABILITY_CACHE_KEY = 'data_availability'
+
+
+def request_time() -> datetime:
+    """Return the UTC timestamp captured when the current request started."""
+    now = g.get('req_time')
+    if now is None:
+        now = g.req_time = datetime.utcnow()
+    return now
+
+
+def wants_pretty() -> bool:
+    """True when the client asked for indented output with ?pretty=1."""
+    return request.args.get('pretty', '').lower() in ('1', 'true')
+
+
+def ojsonify(obj: Any, status: int = 200):
+    """Build a JSON response serialized with the fast codec (compact unless ?pretty=1)."""
+    return current_app.response_class(
+        _json.dumps(obj, indent=wants_pretty()),
+        status=status,
+        mimetype='application/json'
+    )
+
+
+def cached_response(key: str, build_fn: Callable[[], Any], ttl: float):
+    """
+    Serve a JSON payload that rarely changes from pre-serialized bytes.
+    
+    The payload is rebuilt at most once per ``ttl`` seconds and tagged with a
+    strong ETag; clients presenting a matching If-None-Match get an empty 304.
+    """
+    cache = current_app.extensions.setdefault('response_cache', {})
+    now = time.monotonic()
+    entry = cache.get(key)
+    if entry is None or entry[2] <= now:
+        body = _json.dumps(build_fn())
+        etag = hashlib.blake2b(body, digest_size=8).hexdigest()
+        entry = cache[key] = (etag, body, now + ttl)
+    
+    etag, body, _ = entry
+    if request.if_none_match.contains(etag):
+        response = current_app.response_class(status=304)
+    elif wants_pretty():
+        response = ojsonify(_json.loads(body))
+    else:
+        response = current_app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    return response
+
+
+def invalidate_cached_responses(*keys: str) -> None:
+    """Drop cached payloads so the next request rebuilds them."""
+    cache = current_app.extensions.get('response_cache')
+    if cache:
+        for key in keys:
+            cache.pop(key, None)
+
+
+def invalidate_data_availability() -> None:
+    """Forget memoized data availability after metrics/anomalies are written."""
+    if has_app_context():
+        current_app.extensions.pop(AVAILABILITY_CACHE_KEY, None)
@@ -7,14 +7,20 @@ Endpoints for ML-based anomaly detection using Isolation Forest.
 - GET /anomalies/summary - Get summary statistics
 """
 
-import json
+import functools
+import mmap
 import os
 import logging
-from typing import Dict, Any, List
-from datetime import datetime
-from flask import Blueprint, jsonify, request, current_app
+from collections import Counter
+from itertools import islice
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+from flask import Blueprint, request, current_app
 import numpy as np
 
+from api import _json
+from api.responses import (
+    cached_response, invalidate_cached_responses, invalidate_data_availability, ojsonify, request_time
+)
 from app.ml.isolation_forest_model import IsolationForestModel
 from app.ml.feature_extractor import FeatureExtractor
 
@@ -22,27 +28,232 @@ logger = logging.getLogger(__name__)
 
 anomalies_bp = Blueprint('anomalies', __name__)
 
+# Loaded models keyed by (model_dir, model_name) -> (pkl mtime_ns, model)
+_MODEL_CACHE: Dict[Tuple[str, str], Tuple[int, IsolationForestModel]] = {}
 
-def load_metrics_file(filepath: str) -> List[Dict[str, Any]]:
-    """Load metrics from JSONL file."""
-    metrics = []
-    if os.path.exists(filepath):
-        with open(filepath, 'r') as f:
-            for line in f:
-                if line.strip():
-                    try:
-                        metrics.append(json.loads(line))
-                    except:
-                        pass
-    return metrics
+# Detection only uses the extractor's stateless paths (no fit), so one
+# instance is shared across requests
+_EXTRACTOR = FeatureExtractor()
 
 
-def save_anomalies(anomalies: List[Dict[str, Any]], filepath: str):
-    """Save anomalies to JSONL file."""
+def get_model(model_dir: str, model_name: str) -> Optional[IsolationForestModel]:
+    """
+    Return a loaded model, reusing the in-process copy while its file is unchanged.
+    
+    Returns None if the model does not exist or fails to load.
+    """
+    key = (model_dir, model_name)
+    try:
+        mtime_ns = os.stat(os.path.join(model_dir, f'{model_name}.pkl')).st_mtime_ns
+    except OSError:
+        _MODEL_CACHE.pop(key, None)
+        return None
+    
+    cached = _MODEL_CACHE.get(key)
+    if cached is not None and cached[0] == mtime_ns:
+        return cached[1]
+    
+    model = IsolationForestModel(model_dir=model_dir)
+    if not model.load(model_name):
+        _MODEL_CACHE.pop(key, None)
+        return None
+    
+    _MODEL_CACHE[key] = (mtime_ns, model)
+    return model
+
+
+# Files above this size are parsed through mmap instead of a single read()
+MMAP_THRESHOLD_BYTES = 200 * 1024 * 1024
+
+# Records serialized per write() when saving anomalies
+SAVE_CHUNK_RECORDS = 10000
+
+# Seconds a serialized /summary payload is reused
+SUMMARY_CACHE_TTL = 5.0
+
+
+def _load_lenient(lines) -> List[Dict[str, Any]]:
+    """Parse JSONL lines, skipping blank and malformed ones."""
+    records = []
+    for line in lines:
+        if line:
+            try:
+                records.append(_json.loads(line))
+            except _json.JSONDecodeError:
+                pass
+    return records
+
+
+def _load_trusted(lines) -> List[Dict[str, Any]]:
+    """
+    Parse JSONL lines written by save_anomalies without a per-line try/except.
+    
+    Falls back to the lenient parser if the file turns out to be malformed
+    (e.g. hand-edited or truncated).
+    """
+    lines = list(lines)
+    try:
+        return [_json.loads(line) for line in lines]
+    except _json.JSONDecodeError:
+        return _load_lenient(lines)
+
+
+@functools.lru_cache(maxsize=4)
+def _load_cached(filepath: str, mtime_ns: int, size: int, trusted: bool = False) -> Tuple[Dict[str, Any], ...]:
+    """
+    Parse a JSONL file once per (path, mtime, size).
+    
+    The stat fields are only part of the cache key: a rewritten file gets a
+    new mtime/size and therefore a fresh entry. Records are shared between
+    callers and must be treated as read-only.
+    """
+    parse = _load_trusted if trusted else _load_lenient
+    with open(filepath, 'rb') as f:
+        if size > MMAP_THRESHOLD_BYTES:
+            # Avoid holding the raw bytes and the split lines in memory at once
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return tuple(parse(iter(mm.readline, b'')))
+        return tuple(parse(f.read().splitlines()))
+
+
+def _load_jsonl(filepath: str, trusted: bool) -> Sequence[Dict[str, Any]]:
+    try:
+        st = os.stat(filepath)
+    except FileNotFoundError:
+        return ()
+    return _load_cached(filepath, st.st_mtime_ns, st.st_size, trusted)
+
+
+def load_metrics_file(filepath: str) -> Sequence[Dict[str, Any]]:
+    """Load metrics from JSONL file (cached until the file changes)."""
+    return _load_jsonl(filepath, trusted=False)
+
+
+def load_anomalies_file(filepath: str) -> Sequence[Dict[str, Any]]:
+    """Load anomalies written by save_anomalies (cached until the file changes)."""
+    return _load_jsonl(filepath, trusted=True)
+
+
+def summarize_anomalies(anomalies: Sequence[Dict[str, Any]]) -> Dict[str, Any]:
+    """Aggregate counts served by the summary endpoint."""
+    if not anomalies:
+        return {
+            'total': 0,
+            'by_severity': {'low': 0, 'medium': 0, 'high': 0},
+            'anomaly_count': 0,
+        }
+    
+    severity_counts = Counter(a.get('severity') for a in anomalies)
+    by_severity = {
+        'low': severity_counts['low'],
+        'medium': severity_counts['medium'],
+        'high': severity_counts['high'],
+    }
+    
+    anomaly_count = sum(1 for a in anomalies if a.get('is_anomaly'))
+    
+    return {
+        'total': len(anomalies),
+        'anomaly_count': anomaly_count,
+        'normal_count': len(anomalies) - anomaly_count,
+        'by_severity': by_severity,
+        'anomaly_rate': float(anomaly_count / len(anomalies)),
+    }
+
+
+def load_summary_index(filepath: str) -> Optional[Dict[str, Any]]:
+    """
+    Load the summary written next to an anomalies file by save_anomalies.
+    
+    The index records the JSONL's (size, mtime_ns) it was written for;
+    returns None when it is missing or the JSONL has changed since.
+    """
+    try:
+        st = os.stat(filepath)
+        with open(filepath + '.idx', 'rb') as f:
+            entry = _json.loads(f.read())
+        if entry['source'] != [st.st_size, st.st_mtime_ns]:
+            return None
+        return entry['summary']
+    except (OSError, KeyError, TypeError, _json.JSONDecodeError):
+        return None
+
+
+def load_offset_index(filepath: str) -> Optional[np.ndarray]:
+    """
+    Load the line offsets written next to an anomalies file by save_anomalies.
+    
+    Entry i is the byte offset of record i; the final entry is the file size.
+    Returns None when the index is missing or does not match the JSONL file.
+    """
+    try:
+        offsets = np.fromfile(filepath + '.off', dtype=np.int64)
+        if len(offsets) == 0 or offsets[-1] != os.stat(filepath).st_size:
+            return None
+        return offsets
+    except (OSError, ValueError):
+        return None
+
+
+def read_record_range(filepath: str, offsets: np.ndarray, start: int, stop: int) -> List[Dict[str, Any]]:
+    """Parse records [start, stop) by seeking straight to their byte range."""
+    stop = min(stop, len(offsets) - 1)
+    if start >= stop:
+        return []
+    with open(filepath, 'rb') as f:
+        f.seek(int(offsets[start]))
+        chunk = f.read(int(offsets[stop] - offsets[start]))
+    return _load_trusted(chunk.splitlines())
+
+
+def _remove_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def _replace_file(path: str, data: bytes) -> None:
+    """Write data to path atomically via a temp file and os.replace."""
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def save_anomalies(anomalies: List[Dict[str, Any]], filepath: str) -> Dict[str, Any]:
+    """
+    Save anomalies to JSONL file along with summary and line offset indexes.
+    
+    Returns the summary written to the index (see summarize_anomalies).
+    """
     os.makedirs(os.path.dirname(filepath) or '.', exist_ok=True)
-    with open(filepath, 'w') as f:
-        for anomaly in anomalies:
-            f.write(json.dumps(anomaly) + '\n')
+    # Drop the old indexes first so readers never pair them with the new file
+    _remove_file(filepath + '.off')
+    _remove_file(filepath + '.idx')
+    offsets = np.empty(len(anomalies) + 1, dtype=np.int64)
+    offsets[0] = 0
+    tmp_path = filepath + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        # One write per chunk keeps syscalls low without buffering the whole file
+        for start in range(0, len(anomalies), SAVE_CHUNK_RECORDS):
+            lines = [
+                _json.dumps_line(anomaly)
+                for anomaly in anomalies[start:start + SAVE_CHUNK_RECORDS]
+            ]
+            end = start + len(lines)
+            offsets[start + 1:end + 1] = np.cumsum([len(line) for line in lines]) + offsets[start]
+            f.write(b''.join(lines))
+    os.replace(tmp_path, filepath)
+    
+    _replace_file(filepath + '.off', offsets.tobytes())
+    summary = summarize_anomalies(anomalies)
+    st = os.stat(filepath)
+    _replace_file(filepath + '.idx', _json.dumps({
+        'source': [st.st_size, st.st_mtime_ns],
+        'summary': summary,
+    }))
+    return summary
 
 
 @anomalies_bp.route('/', methods=['GET'])
@@ -55,6 +266,8 @@ def list_anomalies():
         - is_anomaly: Filter by true/false
         - limit: Max results (default: 100)
         - offset: Skip N results (default: 0)
+        - count: When filtering, set to 'true' to also compute the filtered
+          total (requires a full scan; otherwise 'total' is null)
     """
     try:
         anomalies_file = os.path.join(
@@ -62,36 +275,49 @@ def list_anomalies():
             'anomalies.jsonl'
         )
         
-        anomalies = load_metrics_file(anomalies_file)
-        
         # Apply filters
         severity = request.args.get('severity')
         is_anomaly_str = request.args.get('is_anomaly')
-        limit = int(request.args.get('limit', 100))
-        offset = int(request.args.get('offset', 0))
-        
-        filtered = anomalies
-        
-        if severity:
-            filtered = [a for a in filtered if a.get('severity') == severity]
+        limit = max(0, int(request.args.get('limit', 100)))
+        offset = max(0, int(request.args.get('offset', 0)))
+        want_count = request.args.get('count', '').lower() == 'true'
         
-        if is_anomaly_str:
-            is_anom = is_anomaly_str.lower() == 'true'
-            filtered = [a for a in filtered if a.get('is_anomaly') == is_anom]
+        if not severity and not is_anomaly_str:
+            offsets = load_offset_index(anomalies_file)
+            if offsets is not None:
+                # Seek straight to the requested page instead of parsing the file
+                total = len(offsets) - 1
+                results = read_record_range(anomalies_file, offsets, offset, offset + limit)
+            else:
+                anomalies = load_anomalies_file(anomalies_file)
+                total = len(anomalies)
+                results = anomalies[offset:offset + limit]
+        else:
+            anomalies = load_anomalies_file(anomalies_file)
+            is_anom = is_anomaly_str.lower() == 'true' if is_anomaly_str else None
+            
+            def matches():
+                for a in anomalies:
+                    if severity and a.get('severity') != severity:
+                        continue
+                    if is_anom is not None and a.get('is_anomaly') != is_anom:
+                        continue
+                    yield a
+            
+            # Stop scanning as soon as the requested page is filled
+            results = list(islice(matches(), offset, offset + limit))
+            total = sum(1 for _ in matches()) if want_count else None
         
-        total = len(filtered)
-        results = filtered[offset:offset + limit]
-        
-        return jsonify({
+        return ojsonify({
             'success': True,
             'count': len(results),
             'total': total,
             'offset': offset,
             'anomalies': results
-        }), 200
+        })
     
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return ojsonify({'success': False, 'error': str(e)}, 500)
 
 
 @anomalies_bp.route('/detect', methods=['POST'])
@@ -124,33 +350,34 @@ def detect_anomalies():
         metrics = load_metrics_file(metrics_file)
         if not metrics:
             logger.error(f"No metrics found in {metrics_file}")
-            return jsonify({'success': False, 'error': 'No metrics found'}), 400
+            return ojsonify({'success': False, 'error': 'No metrics found'}, 400)
         
         logger.info(f"Loaded {len(metrics)} metric windows")
         
         # Load model
-        model = IsolationForestModel(
-            model_dir=current_app.config.get('MODELS_DIR', 'app/ml/models')
+        model = get_model(
+            current_app.config.get('MODELS_DIR', 'app/ml/models'),
+            model_name
         )
         
-        if not model.load(model_name):
+        if model is None:
             logger.error(f"Model not found: {model_name}")
-            return jsonify({
+            return ojsonify({
                 'success': False,
                 'error': f'Model not found: {model_name}'
-            }), 404
+            }, 404)
         
         logger.info(f"Loaded model: {model_name}")
         
         # Extract features
-        extractor = FeatureExtractor()
+        extractor = _EXTRACTOR
         X, valid_indices, stats = extractor.extract_batch(metrics)
         
         logger.info(f"Extracted feature matrix: {X.shape}")
         
         if X.shape[0] == 0:
             logger.error("No valid samples after feature extraction")
-            return jsonify({'success': False, 'error': 'No valid samples'}), 400
+            return ojsonify({'success': False, 'error': 'No valid samples'}, 400)
         
         # Normalize
         X_norm = extractor.normalize(X, fit=False)
@@ -160,10 +387,8 @@ def detect_anomalies():
         results = model.predict_with_insights(X_norm, valid_indices)
         
         # Log individual anomalies
-        anomaly_count = 0
-        for idx, result in enumerate(results):
+        for result in results:
             if result['is_anomaly']:
-                anomaly_count += 1
                 severity = result['severity'].upper()
                 prob = result['anomaly_probability']
                 window_idx = result['index']
@@ -177,36 +402,33 @@ def detect_anomalies():
             current_app.config.get('ANOMALIES_DIR', 'logs'),
             'anomalies.jsonl'
         )
-        save_anomalies(results, anomalies_file)
+        stats = save_anomalies(results, anomalies_file)
+        _load_cached.cache_clear()
+        invalidate_cached_responses('anomaly_summary', 'api_status')
+        invalidate_data_availability()
         logger.info(f"Saved {len(results)} predictions to {anomalies_file}")
         
-        # Summarize
-        summary = {
-            'low': sum(1 for r in results if r['severity'] == 'low'),
-            'medium': sum(1 for r in results if r['severity'] == 'medium'),
-            'high': sum(1 for r in results if r['severity'] == 'high'),
-        }
-        
-        anomaly_count = sum(1 for r in results if r['is_anomaly'])
-        anomaly_rate = float(anomaly_count / len(results)) if results else 0
+        anomaly_count = stats['anomaly_count']
+        summary = stats['by_severity']
+        anomaly_rate = stats.get('anomaly_rate', 0)
         
         logger.info("=" * 70)
         logger.info(f"Anomaly detection complete: {len(results)} windows, {anomaly_count} anomalies ({anomaly_rate:.1%})")
         logger.info(f"By severity: HIGH={summary['high']}, MEDIUM={summary['medium']}, LOW={summary['low']}")
         logger.info("=" * 70)
         
-        return jsonify({
+        return ojsonify({
             'success': True,
             'anomaly_count': anomaly_count,
             'anomalies_by_severity': summary,
             'total_samples': len(results),
             'anomaly_rate': anomaly_rate,
             'message': 'Anomaly detection completed',
-            'timestamp': datetime.utcnow().isoformat(),
-        }), 200
+            'timestamp': request_time(),
+        })
     
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return ojsonify({'success': False, 'error': str(e)}, 500)
 
 
 @anomalies_bp.route('/summary', methods=['GET'])
@@ -218,32 +440,13 @@ def anomaly_summary():
             'anomalies.jsonl'
         )
         
-        anomalies = load_metrics_file(anomalies_file)
+        def build():
+            summary = load_summary_index(anomalies_file)
+            if summary is None:
+                summary = summarize_anomalies(load_anomalies_file(anomalies_file))
+            return {'success': True, **summary}
         
-        if not anomalies:
-            return jsonify({
-                'success': True,
-                'total': 0,
-                'by_severity': {'low': 0, 'medium': 0, 'high': 0},
-                'anomaly_count': 0,
-            }), 200
-        
-        by_severity = {
-            'low': sum(1 for a in anomalies if a.get('severity') == 'low'),
-            'medium': sum(1 for a in anomalies if a.get('severity') == 'medium'),
-            'high': sum(1 for a in anomalies if a.get('severity') == 'high'),
-        }
-        
-        anomaly_count = sum(1 for a in anomalies if a.get('is_anomaly'))
-        
-        return jsonify({
-            'success': True,
-            'total': len(anomalies),
-            'anomaly_count': anomaly_count,
-            'normal_count': len(anomalies) - anomaly_count,
-            'by_severity': by_severity,
-            'anomaly_rate': float(anomaly_count / len(anomalies)),
-        }), 200
+        return cached_response('anomaly_summary', build, ttl=SUMMARY_CACHE_TTL)
     
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return ojsonify({'success': False, 'error': str(e)}, 500)
@@ -1,29 +1,239 @@
 """Model Training and Management Routes"""
 
-import json
+import hashlib
 import os
+import random
+import shutil
 import subprocess
 import sys
-from typing import Dict, Any, Generator, Tuple
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
+from typing import Callable, Dict, Any, Generator, Iterator, Optional, Tuple
 from datetime import datetime
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, current_app, url_for
 import numpy as np
+from werkzeug.utils import secure_filename
+
+from api import _json
+from api._cache import memoize_array, memoize_json
+from api._jobs import prune_jobs, read_job, write_job
+from api.responses import invalidate_cached_responses, invalidate_data_availability, ojsonify
+from api.route_upload import PCAP_SUFFIXES, find_uploaded_file
 
 from app.ml.isolation_forest_model import IsolationForestModel
 from app.ml.feature_extractor import FeatureExtractor
 
 training_bp = Blueprint('training', __name__)
 
+# Cache tags for results derived from metrics.jsonl; bump the version when
+# feature extraction or dataset analysis changes so old entries are ignored
+FEATURES_CACHE_TAG = 'features_v1'
+DATASET_STATS_CACHE_TAG = 'dataset_stats_v2'
+
+
+def _cache_dir(metrics_file: str) -> str:
+    return os.path.join(os.path.dirname(metrics_file) or '.', '.cache')
+
+# Only the head of a PCAP is hashed for the training cache key (together
+# with its size and mtime) so multi-GB captures stay cheap to fingerprint
+PCAP_FINGERPRINT_BYTES = 16 * 1024 * 1024
+
+
+def _pcap_fingerprint(pcap_path: str) -> str:
+    st = os.stat(pcap_path)
+    h = hashlib.sha1(f'{st.st_size}:{st.st_mtime_ns}:'.encode())
+    with open(pcap_path, 'rb') as f:
+        h.update(f.read(PCAP_FINGERPRINT_BYTES))
+    return h.hexdigest()[:16]
+
+
+def _train_cache_path(models_dir: str, pcap_path: str, data: Dict[str, Any]) -> str:
+    """Where the /train result for this capture and parameter set is cached."""
+    key = '_'.join(str(part) for part in (
+        _pcap_fingerprint(pcap_path),
+        float(data.get('contamination', 0.1)),
+        data.get('sample_rate'),
+        data.get('sampling_strategy', 'uniform'),
+        data.get('model_name', 'default'),
+    ))
+    return os.path.join(models_dir, '_cache', f'{secure_filename(key)}.json')
+
+
+def _cached_metrics_path(cache_path: str) -> str:
+    """The metrics a cached /train result was trained on, kept beside its entry."""
+    return os.path.splitext(cache_path)[0] + '.metrics.jsonl'
+
+
+def _load_cached_training(cache_path: str, model_path: str) -> Optional[Dict[str, Any]]:
+    """Return a cached /train result if the model it describes is still on disk unchanged."""
+    try:
+        with open(cache_path, 'rb') as f:
+            entry = _json.loads(f.read())
+        if os.stat(model_path).st_mtime_ns != entry['model_mtime_ns']:
+            return None
+        if not os.path.exists(_cached_metrics_path(cache_path)):
+            return None
+        return entry['result']
+    except (OSError, KeyError, TypeError, _json.JSONDecodeError):
+        return None
+
+
+def _store_cached_training(cache_path: str, model_path: str, result: Dict[str, Any],
+                           run_file: str) -> None:
+    try:
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        _publish_metrics(run_file, _cached_metrics_path(cache_path))
+        entry = {'model_mtime_ns': os.stat(model_path).st_mtime_ns, 'result': result}
+        tmp_path = cache_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(_json.dumps(entry))
+        os.replace(tmp_path, cache_path)
+    except OSError:
+        pass
+
+
+def _reuse_cached_training(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """
+    Answer /train from the cache when this PCAP was already trained with the
+    same parameters.
+    
+    On a hit the metrics that run was trained on are republished as
+    metrics.jsonl, just as a fresh run would leave them. Returns None when
+    the request has to train (no file_id, "force", existing metrics, or no
+    usable cache entry).
+    """
+    file_id = data.get('file_id')
+    if not file_id or data.get('force', False):
+        return None
+    
+    metrics_file = os.path.join(current_app.config.get('METRICS_DIR', 'logs'), 'metrics.jsonl')
+    if data.get('use_existing_metrics', False) and os.path.exists(metrics_file):
+        return None
+    
+    upload_dir = current_app.config.get('UPLOAD_DIR', 'data/uploads')
+    pcap_path = find_uploaded_file(upload_dir, file_id, PCAP_SUFFIXES)
+    if not pcap_path or not os.path.exists(pcap_path):
+        return None
+    
+    models_dir = current_app.config.get('MODELS_DIR', 'app/ml/models')
+    model_path = os.path.join(models_dir, f"{data.get('model_name', 'default')}.pkl")
+    try:
+        cache_path = _train_cache_path(models_dir, pcap_path, data)
+        cached = _load_cached_training(cache_path, model_path)
+        if cached is None:
+            return None
+        _publish_metrics(_cached_metrics_path(cache_path), metrics_file)
+    except (OSError, TypeError, ValueError):
+        return None
+    
+    invalidate_data_availability()
+    invalidate_cached_responses('api_status')
+    return {**cached, 'from_cache': True}
+
+# Background jobs for requests that must first compute metrics from a PCAP
+# (the extraction subprocess can run for minutes). Job state lives on disk
+# (api._jobs) so any server process can answer a status poll
+_job_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='training-job')
+
+
+def _jobs_dir() -> str:
+    return os.path.join(current_app.config.get('MODELS_DIR', 'app/ml/models'), '_jobs')
+
+
+def _needs_metrics_computation(data: Dict[str, Any]) -> bool:
+    metrics_file = os.path.join(current_app.config.get('METRICS_DIR', 'logs'), 'metrics.jsonl')
+    return bool(data.get('file_id')) and not (
+        data.get('use_existing_metrics', False) and os.path.exists(metrics_file)
+    )
+
+
+def _run_job(app, job_id: str, fn: Callable, data: Dict[str, Any]) -> None:
+    with app.app_context():
+        jobs_dir = _jobs_dir()
+        write_job(jobs_dir, job_id, 'running')
+        try:
+            payload, status = fn(data)
+        except Exception as e:
+            payload, status = {'success': False, 'error': str(e)}, 500
+        write_job(jobs_dir, job_id, 'finished', result=payload, result_status=status)
+
+
+def _submit_job(fn: Callable, data: Dict[str, Any]) -> str:
+    app = current_app._get_current_object()
+    jobs_dir = _jobs_dir()
+    job_id = uuid.uuid4().hex
+    write_job(jobs_dir, job_id, 'queued')
+    _job_executor.submit(_run_job, app, job_id, fn, data)
+    prune_jobs(jobs_dir)
+    return job_id
+
+
+def _run_or_submit(fn: Callable[[Dict[str, Any]], Tuple[Dict[str, Any], int]]):
+    """
+    Run a training/analysis handler for the current request.
+    
+    If metrics have to be computed first, the handler is queued and a 202
+    with a job_id is returned (poll GET /jobs/<job_id>); "wait": true in the
+    request body keeps the old blocking behavior.
+    """
+    data = request.get_json() or {}
+    if _needs_metrics_computation(data) and not data.get('wait', False):
+        job_id = _submit_job(fn, data)
+        return ojsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': url_for('training.job_status', job_id=job_id)
+        }, 202)
+    
+    payload, status = fn(data)
+    return ojsonify(payload, status)
+
+
+@training_bp.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id: str):
+    """
+    Status of a background /train or /analyze job.
+    
+    Returns:
+        {
+            "success": bool,
+            "job_id": str,
+            "status": "queued" | "running" | "finished",
+            "result": dict (when finished; the /train or /analyze response),
+            "result_status": int (when finished; its HTTP status)
+        }
+    """
+    record = read_job(_jobs_dir(), job_id)
+    if record is None:
+        return ojsonify({'success': False, 'error': 'Job not found'}, 404)
+    
+    if record['status'] != 'finished':
+        return ojsonify({
+            'success': True,
+            'job_id': job_id,
+            'status': record['status']
+        })
+    
+    return ojsonify({
+        'success': True,
+        'job_id': job_id,
+        'status': 'finished',
+        'result': record.get('result'),
+        'result_status': record.get('result_status')
+    })
+
 def load_metrics_jsonl(filepath: str):
     """Load metrics from JSONL file."""
     metrics = []
     if os.path.exists(filepath):
-        with open(filepath, 'r') as f:
+        with open(filepath, 'rb') as f:
             for line in f:
                 if line.strip():
                     try:
-                        metrics.append(json.loads(line))
-                    except:
+                        metrics.append(_json.loads(line))
+                    except _json.JSONDecodeError:
                         pass
     return metrics
 
@@ -41,20 +251,32 @@ def stream_metrics_jsonl(filepath: str, batch_size: int = 100) -> Generator[Dict
     if not os.path.exists(filepath):
         return
     
-    batch = []
-    with open(filepath, 'r') as f:
+    # Fill fixed-size batches by index instead of growing them with append
+    batch = [None] * batch_size
+    i = 0
+    with open(filepath, 'rb') as f:
         for line in f:
-            if line.strip():
-                try:
-                    batch.append(json.loads(line))
-                    if len(batch) >= batch_size:
-                        yield batch
-                        batch = []
-                except:
-                    pass
+            if not line.strip():
+                continue
+            try:
+                batch[i] = _json.loads(line)
+            except _json.JSONDecodeError:
+                continue
+            i += 1
+            if i == batch_size:
+                yield batch
+                batch = [None] * batch_size
+                i = 0
         
-        if batch:
-            yield batch
+        if i:
+            yield batch[:i]
+
+def iter_metrics_jsonl(filepath: str, batch_size: int = 1024) -> Iterator[Dict[str, Any]]:
+    """Iterate metric windows one at a time without loading the whole file."""
+    return chain.from_iterable(stream_metrics_jsonl(filepath, batch_size))
+
+# Max windows get_dataset_stats inspects to estimate bandwidth variance
+STATS_SAMPLE_SIZE = 4096
 
 def get_dataset_stats(metrics: list) -> Dict[str, Any]:
     """
@@ -79,14 +301,22 @@ def get_dataset_stats(metrics: list) -> Dict[str, Any]:
     
     total_windows = len(metrics)
     
-    # Extract bandwidth data to measure variance
-    bps_values = []
-    for m in metrics:
-        bps = m.get('bandwidth', {}).get('avg_bps', 0)
-        if bps > 0:
-            bps_values.append(bps)
+    # Extract bandwidth data to measure variance; the CV estimate converges
+    # well before the full dataset, so large datasets use a random subset
+    sampled = total_windows > STATS_SAMPLE_SIZE
+    if sampled:
+        indices = random.Random(0).sample(range(total_windows), STATS_SAMPLE_SIZE)
+        sample = (metrics[i] for i in indices)
+    else:
+        sample = metrics
+    bps_values = np.fromiter(
+        (m.get('bandwidth', {}).get('avg_bps', 0) for m in sample),
+        dtype=np.float64,
+        count=min(total_windows, STATS_SAMPLE_SIZE)
+    )
+    bps_values = bps_values[bps_values > 0]
     
-    if bps_values:
+    if bps_values.size:
         mean_bps = np.mean(bps_values)
         std_bps = np.std(bps_values)
         cv = std_bps / mean_bps if mean_bps > 0 else 0  # Coefficient of variation
@@ -111,7 +341,7 @@ def get_dataset_stats(metrics: list) -> Dict[str, Any]:
         training_samples = max(500, int(total_windows * 0.25))
         est_time = 5.0
     
-    return {
+    stats = {
         'total_windows': total_windows,
         'coefficient_of_variation': round(cv, 3),
         'variance_type': 'high' if cv > 0.5 else 'moderate' if cv > 0.2 else 'low',
@@ -120,6 +350,82 @@ def get_dataset_stats(metrics: list) -> Dict[str, Any]:
         'estimated_training_time_seconds': est_time,
         'note': 'High variance detected; stratified sampling recommended' if cv > 0.5 else 'Data is relatively uniform; systematic sampling acceptable'
     }
+    if sampled:
+        stats['sampled_for_stats'] = STATS_SAMPLE_SIZE
+    return stats
+
+def _remove_run_file(path: str) -> None:
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+def _publish_metrics(run_file: str, metrics_file: str) -> None:
+    """Atomically make run_file's contents appear at metrics_file."""
+    tmp_path = f'{metrics_file}.{uuid.uuid4().hex}.tmp'
+    try:
+        # A hard link shares the run file's data, so nothing is copied
+        os.link(run_file, tmp_path)
+    except OSError:
+        shutil.copyfile(run_file, tmp_path)
+    os.replace(tmp_path, metrics_file)
+
+
+def _extract_metrics(pcap_path: str, metrics_file: str) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Compute metrics for a PCAP into a file private to this request.
+    
+    Returns (run_file, None) on success, or (None, error). The run file is
+    also published as metrics_file (the latest metrics, used by
+    use_existing_metrics and /status), but callers keep reading run_file,
+    which a concurrent job cannot overwrite, and remove it when done.
+    """
+    runs_dir = os.path.join(os.path.dirname(metrics_file) or '.', '.runs')
+    os.makedirs(runs_dir, exist_ok=True)
+    run_file = os.path.join(runs_dir, f'{uuid.uuid4().hex}.jsonl')
+    
+    # Compute metrics using subprocess (10% sampling for speed)
+    cmd = [
+        sys.executable,
+        'scripts/extract_metrics_sampled.py',
+        '--pcap', pcap_path,
+        '--sample-rate', '0.10',
+        '--out', run_file
+    ]
+    
+    # Only stderr is ever read (on failure), so stdout is discarded
+    # and stderr is kept as bytes until it is needed
+    try:
+        result = subprocess.run(
+            cmd,
+            cwd=os.getcwd(),
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+            timeout=300
+        )
+    except BaseException:
+        _remove_run_file(run_file)
+        raise
+    
+    if result.returncode != 0:
+        _remove_run_file(run_file)
+        return None, f"Metrics computation failed: {result.stderr.decode('utf-8', errors='replace')}"
+    
+    _publish_metrics(run_file, metrics_file)
+    invalidate_data_availability()
+    invalidate_cached_responses('api_status')
+    return run_file, None
+
+def _analyze_metrics_file(metrics_file: str) -> Dict[str, Any]:
+    """Dataset statistics plus the window count and timestamp span of a metrics file."""
+    metrics = load_metrics_jsonl(metrics_file)
+    return {
+        'analysis': get_dataset_stats(metrics),
+        'metric_windows': len(metrics),
+        'first_timestamp': metrics[0].get('timestamp', 0) if metrics else 0,
+        'last_timestamp': metrics[-1].get('timestamp', 0) if metrics else 0,
+    }
 
 @training_bp.route('/train', methods=['POST'])
 def train_model():
@@ -133,9 +439,19 @@ def train_model():
             "contamination": float (optional, default=0.1),
             "use_existing_metrics": bool (optional),
             "sample_rate": float (optional, 0.0-1.0, None=auto-select),
-            "sampling_strategy": str (optional, 'uniform'/'stratified'/'systematic', default='uniform')
+            "sampling_strategy": str (optional, 'uniform'/'stratified'/'systematic', default='uniform'),
+            "wait": bool (optional, default=false),
+            "force": bool (optional, default=false; retrain even if this PCAP was
+                     already trained with the same parameters)
         }
     
+    A repeat of an earlier run (same PCAP and parameters, model unchanged)
+    is answered at once with that run's result and "from_cache": true, and
+    its metrics are restored as the current metrics.jsonl. Otherwise, if
+    metrics must first be computed from the PCAP, the request is queued
+    and answered with 202 {"job_id": str, "status_url": str} unless "wait"
+    is true; poll GET /jobs/<job_id> for the result below.
+    
     Returns:
         {
             "success": bool,
@@ -148,11 +464,20 @@ def train_model():
             "anomalies_detected": int,
             "anomaly_rate": float,
             "timestamp": str,
-            "recommendation": dict (if auto-selected)
+            "recommendation": dict (if auto-selected),
+            "from_cache": bool (present when an earlier identical run was reused)
         }
     """
+    cached = _reuse_cached_training(request.get_json() or {})
+    if cached is not None:
+        return ojsonify(cached)
+    return _run_or_submit(_train_model)
+
+def _train_model(data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Train a model from request data; returns (payload, http_status)."""
+    # Metrics computed for this request only (see _extract_metrics)
+    run_file = None
     try:
-        data = request.get_json() or {}
         file_id = data.get('file_id')
         model_name = data.get('model_name', 'default')
         contamination = float(data.get('contamination', 0.1))
@@ -161,69 +486,69 @@ def train_model():
         sampling_strategy = data.get('sampling_strategy', 'uniform')
         
         if not file_id:
-            return jsonify({'success': False, 'error': 'file_id required'}), 400
+            return {'success': False, 'error': 'file_id required'}, 400
+        
+        models_dir = current_app.config.get('MODELS_DIR', 'app/ml/models')
+        model_path = os.path.join(models_dir, f'{model_name}.pkl')
+        cache_path = None
         
         # Load or compute metrics
         metrics_file = os.path.join(current_app.config.get('METRICS_DIR', 'logs'), 'metrics.jsonl')
         
-        if use_existing and os.path.exists(metrics_file):
-            metrics = load_metrics_jsonl(metrics_file)
-        else:
+        if not (use_existing and os.path.exists(metrics_file)):
             # Find PCAP file
             upload_dir = current_app.config.get('UPLOAD_DIR', 'data/uploads')
-            pcap_path = None
-            for f in os.listdir(upload_dir):
-                if file_id in f:
-                    pcap_path = os.path.join(upload_dir, f)
-                    break
+            pcap_path = find_uploaded_file(upload_dir, file_id, PCAP_SUFFIXES)
             
             if not pcap_path or not os.path.exists(pcap_path):
-                return jsonify({'success': False, 'error': 'PCAP file not found'}), 404
-            
-            # Compute metrics using subprocess (10% sampling for speed)
-            cmd = [
-                sys.executable,
-                'scripts/extract_metrics_sampled.py',
-                '--pcap', pcap_path,
-                '--sample-rate', '0.10',
-                '--out', metrics_file
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                cwd=os.getcwd(),
-                capture_output=True,
-                text=True,
-                timeout=300
-            )
+                return {'success': False, 'error': 'PCAP file not found'}, 404
             
-            if result.returncode != 0:
-                return jsonify({
-                    'success': False,
-                    'error': f'Metrics computation failed: {result.stderr}'
-                }), 500
+            # Key under which this run is cached for _reuse_cached_training
+            cache_path = _train_cache_path(models_dir, pcap_path, data)
             
-            metrics = load_metrics_jsonl(metrics_file)
+            run_file, error = _extract_metrics(pcap_path, metrics_file)
+            if error is not None:
+                return {'success': False, 'error': error}, 500
         
-        if len(metrics) < 10:
-            return jsonify({
+        # Cheap upper bound on the window count before parsing anything
+        line_count = _json.count_jsonl_lines(run_file or metrics_file)
+        if line_count < 10:
+            return {
                 'success': False,
-                'error': f'Need at least 10 metric windows, got {len(metrics)}'
-            }), 400
+                'error': f'Need at least 10 metric windows, got {line_count}'
+            }, 400
         
-        # Extract features
+        # Extract features while streaming the metrics file (parse and
+        # extraction happen in one pass without materializing every window);
+        # for existing metrics the raw matrix is reused until metrics.jsonl changes
         extractor = FeatureExtractor()
-        X, valid_indices, sampling_stats = extractor.extract_batch(
-            metrics,
+        if run_file is not None:
+            X_all = extractor.extract_all(iter_metrics_jsonl(run_file))
+        else:
+            X_all = memoize_array(
+                metrics_file,
+                FEATURES_CACHE_TAG,
+                lambda: extractor.extract_all(iter_metrics_jsonl(metrics_file)),
+                _cache_dir(metrics_file)
+            )
+        X, valid_indices, sampling_stats = extractor.sample_features(
+            X_all,
             sample_rate=sample_rate,
             sampling_strategy=sampling_strategy
         )
         
+        total_windows = sampling_stats['total_windows']
+        if total_windows < 10:
+            return {
+                'success': False,
+                'error': f'Need at least 10 metric windows, got {total_windows}'
+            }, 400
+        
         if X.shape[0] < 10:
-            return jsonify({
+            return {
                 'success': False,
                 'error': f'Not enough valid samples after feature extraction: {X.shape[0]}'
-            }), 400
+            }, 400
         
         # Auto-select sample rate if not specified
         recommendation = None
@@ -233,8 +558,8 @@ def train_model():
             
             # Re-sample if recommendation differs from current
             if auto_rate != 1.0:
-                X, valid_indices, sampling_stats = extractor.extract_batch(
-                    metrics,
+                X, valid_indices, sampling_stats = extractor.sample_features(
+                    X_all,
                     sample_rate=auto_rate,
                     sampling_strategy=sampling_strategy
                 )
@@ -245,7 +570,7 @@ def train_model():
         # Train model
         model = IsolationForestModel(
             contamination=contamination,
-            model_dir=current_app.config.get('MODELS_DIR', 'app/ml/models')
+            model_dir=models_dir
         )
         
         result = model.train(X_norm, extractor.get_feature_names(), model_name)
@@ -261,12 +586,18 @@ def train_model():
         if recommendation:
             result['auto_recommendation'] = recommendation
         
-        return jsonify(result), 200
+        if cache_path is not None:
+            _store_cached_training(cache_path, model_path, result, run_file)
+        
+        return result, 200
     
     except subprocess.TimeoutExpired:
-        return jsonify({'success': False, 'error': 'Metrics computation timed out'}), 500
+        return {'success': False, 'error': 'Metrics computation timed out'}, 500
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return {'success': False, 'error': str(e)}, 500
+    finally:
+        if run_file is not None:
+            _remove_run_file(run_file)
 
 @training_bp.route('/analyze', methods=['POST'])
 def analyze_dataset():
@@ -276,9 +607,14 @@ def analyze_dataset():
     Request body:
         {
             "file_id": str,
-            "use_existing_metrics": bool (optional)
+            "use_existing_metrics": bool (optional),
+            "wait": bool (optional, default=false)
         }
     
+    If metrics must first be computed from the PCAP, the request is queued
+    and answered with 202 {"job_id": str, "status_url": str} unless "wait"
+    is true; poll GET /jobs/<job_id> for the result below.
+    
     Returns:
         {
             "success": bool,
@@ -297,67 +633,66 @@ def analyze_dataset():
             }
         }
     """
+    return _run_or_submit(_analyze_dataset)
+
+def _analyze_dataset(data: Dict[str, Any]) -> Tuple[Dict[str, Any], int]:
+    """Analyze a dataset from request data; returns (payload, http_status)."""
+    # Metrics computed for this request only (see _extract_metrics)
+    run_file = None
     try:
-        data = request.get_json() or {}
         file_id = data.get('file_id')
         use_existing = data.get('use_existing_metrics', False)
         
         if not file_id:
-            return jsonify({'success': False, 'error': 'file_id required'}), 400
+            return {'success': False, 'error': 'file_id required'}, 400
         
         # Load or compute metrics
         metrics_file = os.path.join(current_app.config.get('METRICS_DIR', 'logs'), 'metrics.jsonl')
         
-        if use_existing and os.path.exists(metrics_file):
-            metrics = load_metrics_jsonl(metrics_file)
-        else:
+        if not (use_existing and os.path.exists(metrics_file)):
             # Find PCAP file
             upload_dir = current_app.config.get('UPLOAD_DIR', 'data/uploads')
             pcap_path = None
             pcap_size_mb = 0
             
-            for f in os.listdir(upload_dir):
-                if file_id in f:
-                    pcap_path = os.path.join(upload_dir, f)
-                    pcap_size_mb = os.path.getsize(pcap_path) / (1024**2)
-                    break
+            pcap_path = find_uploaded_file(upload_dir, file_id, PCAP_SUFFIXES)
+            if pcap_path is not None:
+                pcap_size_mb = os.path.getsize(pcap_path) / (1024**2)
             
             if not pcap_path or not os.path.exists(pcap_path):
-                return jsonify({'success': False, 'error': 'PCAP file not found'}), 404
+                return {'success': False, 'error': 'PCAP file not found'}, 404
             
-            # Compute metrics using subprocess (10% sampling for speed)
-            cmd = [
-                sys.executable,
-                'scripts/extract_metrics_sampled.py',
-                '--pcap', pcap_path,
-                '--sample-rate', '0.10',
-                '--out', metrics_file
-            ]
-            
-            result = subprocess.run(
-                cmd,
-                cwd=os.getcwd(),
-                capture_output=True,
-                text=True,
-                timeout=300
+            run_file, error = _extract_metrics(pcap_path, metrics_file)
+            if error is not None:
+                return {'success': False, 'error': error}, 500
+        
+        # Cheap upper bound on the window count before parsing anything
+        line_count = _json.count_jsonl_lines(run_file or metrics_file)
+        if line_count < 5:
+            return {
+                'success': False,
+                'error': f'Not enough metric windows: {line_count}'
+            }, 400
+        
+        # Analyze dataset (existing metrics are reused until metrics.jsonl changes)
+        if run_file is not None:
+            dataset = _analyze_metrics_file(run_file)
+        else:
+            dataset = memoize_json(
+                metrics_file,
+                DATASET_STATS_CACHE_TAG,
+                lambda: _analyze_metrics_file(metrics_file),
+                _cache_dir(metrics_file)
             )
-            
-            if result.returncode != 0:
-                return jsonify({
-                    'success': False,
-                    'error': f'Metrics computation failed: {result.stderr}'
-                }), 500
-            
-            metrics = load_metrics_jsonl(metrics_file)
+        metric_windows = dataset['metric_windows']
         
-        if len(metrics) < 5:
-            return jsonify({
+        if metric_windows < 5:
+            return {
                 'success': False,
-                'error': f'Not enough metric windows: {len(metrics)}'
-            }), 400
+                'error': f'Not enough metric windows: {metric_windows}'
+            }, 400
         
-        # Analyze dataset
-        analysis = get_dataset_stats(metrics)
+        analysis = dataset['analysis']
         
         # Add file info if available
         if pcap_path:
@@ -367,23 +702,26 @@ def analyze_dataset():
             }
             
             # Estimate duration from timestamps if available
-            if metrics and len(metrics) > 1:
-                first_ts = metrics[0].get('timestamp', 0)
-                last_ts = metrics[-1].get('timestamp', 0)
+            if metric_windows > 1:
+                first_ts = dataset['first_timestamp']
+                last_ts = dataset['last_timestamp']
                 if last_ts > first_ts:
                     duration = last_ts - first_ts
                     analysis['dataset_info']['duration_seconds'] = int(duration)
-                    analysis['dataset_info']['metric_windows'] = len(metrics)
+                    analysis['dataset_info']['metric_windows'] = metric_windows
         
-        return jsonify({
+        return {
             'success': True,
             'analysis': analysis
-        }), 200
+        }, 200
     
     except subprocess.TimeoutExpired:
-        return jsonify({'success': False, 'error': 'Metrics computation timed out'}), 500
+        return {'success': False, 'error': 'Metrics computation timed out'}, 500
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return {'success': False, 'error': str(e)}, 500
+    finally:
+        if run_file is not None:
+            _remove_run_file(run_file)
 
 @training_bp.route('/models', methods=['GET'])
 def list_models():
@@ -394,14 +732,14 @@ def list_models():
         )
         models = model.list_models()
         
-        return jsonify({
+        return ojsonify({
             'success': True,
             'models': models,
             'count': len(models)
-        }), 200
+        })
     
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return ojsonify({'success': False, 'error': str(e)}, 500)
 
 @training_bp.route('/models/<model_name>', methods=['DELETE'])
 def delete_model(model_name: str):
@@ -420,9 +758,9 @@ def delete_model(model_name: str):
             removed = True
         
         if not removed:
-            return jsonify({'success': False, 'error': 'Model not found'}), 404
+            return ojsonify({'success': False, 'error': 'Model not found'}, 404)
         
-        return jsonify({'success': True, 'message': 'Model deleted'}), 200
+        return ojsonify({'success': True, 'message': 'Model deleted'})
     
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return ojsonify({'success': False, 'error': str(e)}, 500)
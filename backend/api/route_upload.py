@@ -1,19 +1,111 @@
 """File Upload and Management Routes"""
 
+import functools
+import io
+import logging
 import os
+import re
 import json
-from typing import Dict, Any
+import shutil
+import sqlite3
+from typing import Dict, Any, Optional, Tuple
 from werkzeug.utils import secure_filename
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, request, current_app
 from datetime import datetime
 
+from api._file_index import add_file, close_connections, lookup_file, remove_file
+from api.responses import ojsonify, request_time
+
+logger = logging.getLogger(__name__)
+
 upload_bp = Blueprint('upload', __name__)
 
 ALLOWED_EXTENSIONS = {'pcap', 'pcapng'}
 
+_ALLOWED_RE = re.compile(
+    r'.*\.(?:%s)\Z' % '|'.join(sorted(ALLOWED_EXTENSIONS)),
+    re.IGNORECASE | re.DOTALL
+)
+
 def allowed_file(filename: str) -> bool:
     """Check if file extension is allowed."""
-    return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
+    return _ALLOWED_RE.match(filename) is not None
+
+# The same names are uploaded repeatedly while testing captures
+_secure_filename = functools.lru_cache(maxsize=256)(secure_filename)
+
+PCAP_SUFFIXES = ('.pcap', '.pcapng')
+
+def find_uploaded_file(upload_dir: str, file_id: str,
+                       suffixes: Optional[Tuple[str, ...]] = None) -> Optional[str]:
+    """
+    Return the path of the upload for file_id, or None.
+    
+    Exact file_ids are resolved through the upload index. Otherwise (e.g.
+    files copied in by hand, or a partial id) this falls back to the first
+    upload whose name contains file_id and ends with one of suffixes, if given.
+    Dotfiles (such as the upload index itself) are never matched.
+    """
+    try:
+        path = lookup_file(upload_dir, file_id)
+        if path is not None:
+            return path
+    except sqlite3.Error as e:
+        logger.warning(f"Upload index unavailable, scanning {upload_dir}: {e}")
+    
+    with os.scandir(upload_dir) as it:
+        for entry in it:
+            if (not entry.name.startswith('.') and file_id in entry.name
+                    and (suffixes is None or entry.name.endswith(suffixes))):
+                return entry.path
+    return None
+
+# On app-context teardown rather than request teardown, so background
+# training jobs (which push only an app context) close their connections too
+upload_bp.record_once(lambda state: state.app.teardown_appcontext(close_connections))
+
+COPY_BUFFER_SIZE = 4 * 1024 * 1024
+
+def _save_upload(file, filepath: str) -> None:
+    """
+    Write an uploaded file to disk.
+    
+    When the upload is backed by a real file descriptor (werkzeug spools
+    large uploads to a temp file), the bytes are copied in the kernel with
+    os.sendfile; small or in-memory uploads (and platforms without
+    file-to-file sendfile) fall back to a large-buffer copy.
+    """
+    src = file.stream
+    src_fd = None
+    # Uploads that fit in one copy buffer are not worth a sendfile; this also
+    # keeps fileno() from rolling a small in-memory SpooledTemporaryFile to disk
+    src.seek(0, os.SEEK_END)
+    if hasattr(os, 'sendfile') and src.tell() > COPY_BUFFER_SIZE:
+        try:
+            src_fd = src.fileno()
+        except (AttributeError, OSError, io.UnsupportedOperation):
+            src_fd = None
+    
+    if src_fd is not None:
+        src.flush()
+        size = os.fstat(src_fd).st_size
+        dst_fd = os.open(filepath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+        try:
+            offset = 0
+            while offset < size:
+                sent = os.sendfile(dst_fd, src_fd, offset, size - offset)
+                if sent == 0:
+                    break
+                offset += sent
+            return
+        except OSError:
+            pass  # e.g. sendfile between regular files unsupported; copy instead
+        finally:
+            os.close(dst_fd)
+    
+    src.seek(0)
+    with open(filepath, 'wb') as dst:
+        shutil.copyfileobj(src, dst, COPY_BUFFER_SIZE)
 
 @upload_bp.route('/upload', methods=['POST'])
 def upload_pcap():
@@ -31,41 +123,46 @@ def upload_pcap():
         }
     """
     if 'file' not in request.files:
-        return jsonify({'success': False, 'error': 'No file provided'}), 400
+        return ojsonify({'success': False, 'error': 'No file provided'}, 400)
     
     file = request.files['file']
     
     if file.filename == '':
-        return jsonify({'success': False, 'error': 'No file selected'}), 400
+        return ojsonify({'success': False, 'error': 'No file selected'}, 400)
     
     if not allowed_file(file.filename):
-        return jsonify({'success': False, 'error': 'Only .pcap and .pcapng files allowed'}), 400
+        return ojsonify({'success': False, 'error': 'Only .pcap and .pcapng files allowed'}, 400)
     
     try:
         upload_dir = current_app.config.get('UPLOAD_DIR', 'data/uploads')
         os.makedirs(upload_dir, exist_ok=True)
         
-        filename = secure_filename(file.filename)
-        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S_')
+        filename = _secure_filename(file.filename)
+        uploaded_at = request_time()
+        timestamp = uploaded_at.strftime('%Y%m%d_%H%M%S_')
         saved_filename = timestamp + filename
         filepath = os.path.join(upload_dir, saved_filename)
         
-        file.save(filepath)
+        _save_upload(file, filepath)
         file_size = os.path.getsize(filepath)
         
         file_id = saved_filename.replace('.pcap', '').replace('.pcapng', '')
+        try:
+            add_file(upload_dir, file_id, filepath)
+        except sqlite3.Error as e:
+            logger.warning(f"Could not index upload {saved_filename}: {e}")
         
-        return jsonify({
+        return ojsonify({
             'success': True,
             'file_id': file_id,
             'filename': saved_filename,
             'size': file_size,
-            'uploaded_at': datetime.utcnow().isoformat(),
+            'uploaded_at': uploaded_at,
             'message': f'File uploaded successfully: {saved_filename}'
-        }), 200
+        })
     
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return ojsonify({'success': False, 'error': str(e)}, 500)
 
 @upload_bp.route('/files', methods=['GET'])
 def list_files():
@@ -74,24 +171,23 @@ def list_files():
         upload_dir = current_app.config.get('UPLOAD_DIR', 'data/uploads')
         
         if not os.path.exists(upload_dir):
-            return jsonify({'success': True, 'files': []}), 200
+            return ojsonify({'success': True, 'files': []})
         
         files = []
-        for filename in os.listdir(upload_dir):
-            if filename.endswith(('.pcap', '.pcapng')):
-                filepath = os.path.join(upload_dir, filename)
-                size = os.path.getsize(filepath)
-                mtime = os.path.getmtime(filepath)
-                files.append({
-                    'filename': filename,
-                    'size': size,
-                    'uploaded_at': datetime.fromtimestamp(mtime).isoformat(),
-                })
+        with os.scandir(upload_dir) as it:
+            for entry in it:
+                if entry.name.endswith(PCAP_SUFFIXES):
+                    st = entry.stat()
+                    files.append({
+                        'filename': entry.name,
+                        'size': st.st_size,
+                        'uploaded_at': datetime.fromtimestamp(st.st_mtime).isoformat(),
+                    })
         
-        return jsonify({'success': True, 'files': files}), 200
+        return ojsonify({'success': True, 'files': files})
     
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return ojsonify({'success': False, 'error': str(e)}, 500)
 
 @upload_bp.route('/delete/<file_id>', methods=['DELETE'])
 def delete_file(file_id: str):
@@ -100,13 +196,16 @@ def delete_file(file_id: str):
         upload_dir = current_app.config.get('UPLOAD_DIR', 'data/uploads')
         
         # Find and delete the file
-        for filename in os.listdir(upload_dir):
-            if file_id in filename and filename.endswith(('.pcap', '.pcapng')):
-                filepath = os.path.join(upload_dir, filename)
-                os.remove(filepath)
-                return jsonify({'success': True, 'message': 'File deleted'}), 200
+        filepath = find_uploaded_file(upload_dir, file_id, PCAP_SUFFIXES)
+        if filepath is not None:
+            os.remove(filepath)
+            try:
+                remove_file(upload_dir, file_id)
+            except sqlite3.Error as e:
+                logger.warning(f"Could not update upload index: {e}")
+            return ojsonify({'success': True, 'message': 'File deleted'})
         
-        return jsonify({'success': False, 'error': 'File not found'}), 404
+        return ojsonify({'success': False, 'error': 'File not found'}, 404)
     
     except Exception as e:
-        return jsonify({'success': False, 'error': str(e)}), 500
+        return ojsonify({'success': False, 'error': str(e)}, 500)
@@ -8,32 +8,52 @@ Endpoints for system control and live capture management.
 - GET /capture/status - Live capture status
 """
 
+import functools
 import json
 import os
+import shutil
 import subprocess
 import sys
 import threading
 import time
-from typing import Dict, Any, Optional
+from collections import namedtuple
+from typing import Dict, Any, List, Optional
 from datetime import datetime
-from flask import Blueprint, jsonify, request, current_app
+from flask import Blueprint, request, current_app
+
+from api._io import io_map
+from api._json import count_jsonl_lines
+from api.responses import ojsonify, request_time
 
 control_bp = Blueprint('control', __name__)
 
 # Global state for live capture
+CaptureState = namedtuple('CaptureState', 'running start_time packets_captured interface pcap_file')
+
 live_capture_process: Optional[subprocess.Popen] = None
 live_capture_thread: Optional[threading.Thread] = None
-capture_state = {
-    'running': False,
-    'start_time': None,
-    'packets_captured': 0,
-    'interface': None,
-    'pcap_file': None
-}
+# Immutable snapshot: handlers read it once and writers publish a replacement
+# under _capture_lock, so readers never see a half-updated state
+capture_state = CaptureState(
+    running=False,
+    start_time=None,
+    packets_captured=0,
+    interface=None,
+    pcap_file=None
+)
+_capture_lock = threading.Lock()
 
+# Where the live capture subprocess's stdout/stderr are appended
+CAPTURE_LOG_DIR = 'logs'
 
+
+@functools.lru_cache(maxsize=1)
 def get_system_info() -> Dict[str, Any]:
-    """Get system and dependency information."""
+    """
+    Get system and dependency information.
+    
+    None of this changes while the server runs, so it is computed once.
+    """
     info = {
         'python_version': f"{sys.version_info.major}.{sys.version_info.minor}.{sys.version_info.micro}",
         'platform': sys.platform,
@@ -48,15 +68,30 @@ def get_system_info() -> Dict[str, Any]:
     }
     
     # Check for tshark
-    try:
-        result = subprocess.run(['which', 'tshark'], capture_output=True, text=True)
-        info['tshark_available'] = result.returncode == 0
-    except:
-        info['tshark_available'] = False
+    info['tshark_available'] = shutil.which('tshark') is not None
     
     return info
 
 
+@functools.lru_cache(maxsize=16)
+def _count_lines_cached(filepath: str, mtime_ns: int, size: int) -> int:
+    return count_jsonl_lines(filepath)
+
+
+def _count_lines(filepath: str) -> int:
+    """
+    Count lines in a file, returning 0 if it cannot be read.
+    
+    Counts are reused until the file's mtime or size changes, so repeated
+    /status polls do not rescan unchanged files.
+    """
+    try:
+        st = os.stat(filepath)
+        return _count_lines_cached(filepath, st.st_mtime_ns, st.st_size)
+    except OSError:
+        return 0
+
+
 @control_bp.route('/status', methods=['GET'])
 def control_status():
     """
@@ -83,41 +118,39 @@ def control_status():
         )
     }
     
-    # Count records if they exist
-    if data['metrics']:
-        try:
-            with open(os.path.join(metrics_dir, 'metrics.jsonl')) as f:
-                data['metric_count'] = sum(1 for _ in f)
-        except:
-            data['metric_count'] = 0
-    
-    if data['anomalies']:
-        try:
-            with open(os.path.join(metrics_dir, 'anomalies.jsonl')) as f:
-                data['anomaly_count'] = sum(1 for _ in f)
-        except:
-            data['anomaly_count'] = 0
-    
-    return jsonify({
+    # Count records if they exist (both files are read concurrently)
+    counted = [
+        (key, os.path.join(metrics_dir, filename))
+        for key, filename, present in (
+            ('metric_count', 'metrics.jsonl', data['metrics']),
+            ('anomaly_count', 'anomalies.jsonl', data['anomalies']),
+        )
+        if present
+    ]
+    counts = io_map(_count_lines, [path for _, path in counted])
+    for (key, _), count in zip(counted, counts):
+        data[key] = count
+    
+    return ojsonify({
         'api': {
             'status': 'running',
             'version': '1.0.0',
             'mode': current_app.config.get('MODE'),
-            'timestamp': datetime.utcnow().isoformat()
+            'timestamp': request_time()
         },
         'system': get_system_info(),
         'data': data,
-        'capture': capture_state
-    }), 200
+        'capture': capture_state._asdict()
+    })
 
 
 @control_bp.route('/ping', methods=['GET'])
 def ping():
     """Simple health check."""
-    return jsonify({
+    return ojsonify({
         'pong': True,
-        'timestamp': datetime.utcnow().isoformat()
-    }), 200
+        'timestamp': request_time()
+    })
 
 
 @control_bp.route('/config', methods=['GET'])
@@ -134,7 +167,7 @@ def get_config():
             "directories": {...}
         }
     """
-    return jsonify({
+    return ojsonify({
         'mode': current_app.config.get('MODE'),
         'pcap_file': current_app.config.get('PCAP_FILE'),
         'interface': current_app.config.get('INTERFACE'),
@@ -144,7 +177,7 @@ def get_config():
             'baselines': current_app.config.get('BASELINES_DIR'),
             'anomalies': current_app.config.get('METRICS_DIR')
         }
-    }), 200
+    })
 
 
 @control_bp.route('/capture/start', methods=['POST'])
@@ -167,33 +200,34 @@ def start_capture():
             "start_time": str
         }
     """
-    global capture_state
+    global capture_state, live_capture_process
     
     data = request.get_json() or {}
     
     # Check if already capturing
-    if capture_state['running']:
-        return jsonify({
+    state = capture_state
+    if state.running:
+        return ojsonify({
             'success': False,
             'error': 'Capture already running',
-            'start_time': capture_state['start_time']
-        }), 400
+            'start_time': state.start_time
+        }, 400)
     
     mode = current_app.config.get('MODE')
     
     if mode != 'live':
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': f'Cannot start live capture in {mode} mode. Start API with --mode live'
-        }), 400
+        }, 400)
     
     interface = data.get('interface', current_app.config.get('INTERFACE'))
     
     if not interface:
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': 'Interface not specified. Provide --interface or in request body'
-        }), 400
+        }, 400)
     
     output_file = data.get('output_file', 'logs/live_capture.jsonl')
     duration = data.get('duration')
@@ -210,35 +244,50 @@ def start_capture():
         if duration:
             cmd.extend(['--duration', str(duration)])
         
-        # Start process
-        live_capture_process = subprocess.Popen(
-            cmd,
-            cwd=os.getcwd(),
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            text=True
-        )
+        with _capture_lock:
+            # Another request may have started a capture since the check above
+            if capture_state.running:
+                return ojsonify({
+                    'success': False,
+                    'error': 'Capture already running',
+                    'start_time': capture_state.start_time
+                }, 400)
+            
+            # Start process; its output goes straight to log files, since
+            # pipes nobody reads fill up and stall the capture. The child
+            # keeps its own handles, so ours are closed once it has started.
+            os.makedirs(CAPTURE_LOG_DIR, exist_ok=True)
+            with open(os.path.join(CAPTURE_LOG_DIR, 'live_capture.stdout.log'), 'ab') as stdout_f, \
+                    open(os.path.join(CAPTURE_LOG_DIR, 'live_capture.stderr.log'), 'ab') as stderr_f:
+                live_capture_process = subprocess.Popen(
+                    cmd,
+                    cwd=os.getcwd(),
+                    stdout=stdout_f,
+                    stderr=stderr_f
+                )
+            
+            # Update state
+            state = capture_state = capture_state._replace(
+                running=True,
+                start_time=datetime.now().isoformat(),
+                interface=interface,
+                pcap_file=output_file
+            )
         
-        # Update state
-        capture_state['running'] = True
-        capture_state['start_time'] = datetime.now().isoformat()
-        capture_state['interface'] = interface
-        capture_state['pcap_file'] = output_file
-        
-        return jsonify({
+        return ojsonify({
             'success': True,
             'message': f'Live capture started on {interface}',
             'interface': interface,
             'output_file': output_file,
-            'start_time': capture_state['start_time'],
+            'start_time': state.start_time,
             'duration': duration
-        }), 200
+        })
     
     except Exception as e:
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': str(e)
-        }), 400
+        }, 400)
 
 
 @control_bp.route('/capture/stop', methods=['POST'])
@@ -256,49 +305,52 @@ def stop_capture():
     """
     global capture_state, live_capture_process
     
-    if not capture_state['running']:
-        return jsonify({
-            'success': False,
-            'error': 'No capture currently running'
-        }), 400
-    
     try:
-        # Terminate process
-        if live_capture_process:
-            live_capture_process.terminate()
-            live_capture_process.wait(timeout=5)
+        with _capture_lock:
+            state = capture_state
+            if not state.running:
+                return ojsonify({
+                    'success': False,
+                    'error': 'No capture currently running'
+                }, 400)
+            
+            # Terminate process
+            if live_capture_process:
+                live_capture_process.terminate()
+                live_capture_process.wait(timeout=5)
+            
+            # Update state
+            capture_state = state._replace(running=False)
         
         # Calculate duration
-        start = datetime.fromisoformat(capture_state['start_time'])
+        start = datetime.fromisoformat(state.start_time)
         duration = (datetime.now() - start).total_seconds()
         
-        output_file = capture_state['pcap_file']
+        output_file = state.pcap_file
         
-        # Update state
-        capture_state['running'] = False
-        
-        return jsonify({
+        return ojsonify({
             'success': True,
             'message': 'Live capture stopped',
             'duration': round(duration, 2),
             'output_file': output_file
-        }), 200
+        })
     
     except subprocess.TimeoutExpired:
-        if live_capture_process:
-            live_capture_process.kill()
-        capture_state['running'] = False
+        with _capture_lock:
+            if live_capture_process:
+                live_capture_process.kill()
+            capture_state = capture_state._replace(running=False)
         
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': 'Process termination timeout'
-        }), 500
+        }, 500)
     
     except Exception as e:
-        return jsonify({
+        return ojsonify({
             'success': False,
             'error': str(e)
-        }), 400
+        }, 400)
 
 
 @control_bp.route('/capture/status', methods=['GET'])
@@ -315,22 +367,59 @@ def capture_status():
             "output_file": str
         }
     """
-    if not capture_state['running']:
-        return jsonify({
+    state = capture_state
+    if not state.running:
+        return ojsonify({
             'running': False,
             'message': 'No active capture'
-        }), 200
+        })
     
-    start = datetime.fromisoformat(capture_state['start_time'])
+    start = datetime.fromisoformat(state.start_time)
     duration = (datetime.now() - start).total_seconds()
     
-    return jsonify({
+    return ojsonify({
         'running': True,
-        'start_time': capture_state['start_time'],
+        'start_time': state.start_time,
         'duration': round(duration, 2),
-        'interface': capture_state['interface'],
-        'output_file': capture_state['pcap_file']
-    }), 200
+        'interface': state.interface,
+        'output_file': state.pcap_file
+    })
+
+
+TAIL_BLOCK_SIZE = 64 * 1024
+
+
+def _tail_bytes(filepath: str, n: int) -> bytes:
+    """Return the raw bytes of the last n lines of a file, reading backwards from the end."""
+    if n <= 0:
+        return b''
+    
+    chunks = []
+    newlines = 0
+    with open(filepath, 'rb') as f:
+        pos = f.seek(0, os.SEEK_END)
+        # One newline more than n guarantees the first returned line is whole
+        while pos > 0 and newlines <= n:
+            step = min(TAIL_BLOCK_SIZE, pos)
+            pos -= step
+            f.seek(pos)
+            chunk = f.read(step)
+            chunks.append(chunk)
+            newlines += chunk.count(b'\n')
+    
+    data = b''.join(reversed(chunks))
+    cut = len(data) - 1 if data.endswith(b'\n') else len(data)
+    for _ in range(n):
+        cut = data.rfind(b'\n', 0, cut)
+        if cut < 0:
+            return data
+    return data[cut + 1:]
+
+
+def _tail_lines(filepath: str, n: int) -> List[str]:
+    """Return the last n lines of a file as strings."""
+    lines = _tail_bytes(filepath, n).splitlines(keepends=True)
+    return [line.decode('utf-8', errors='replace') for line in lines[-n:]]
 
 
 @control_bp.route('/logs', methods=['GET'])
@@ -341,6 +430,8 @@ def get_logs():
     Query parameters:
         - limit: Number of recent lines to return (default: 100)
         - type: 'app' or 'analysis' (default: app)
+        - format: 'json' or 'raw' (default: json); raw returns the tail
+          as text/plain exactly as it appears in the file
     
     Returns:
         {
@@ -356,27 +447,29 @@ def get_logs():
     }.get(log_type, 'logs/app.log')
     
     if not os.path.exists(log_file):
-        return jsonify({
+        return ojsonify({
             'logs': [],
             'message': f'Log file not found: {log_file}'
-        }), 200
+        })
     
     try:
-        # Get last N lines
-        with open(log_file, 'r') as f:
-            lines = f.readlines()
+        if request.args.get('format') == 'raw':
+            return current_app.response_class(
+                _tail_bytes(log_file, limit),
+                mimetype='text/plain'
+            )
         
-        recent = lines[-limit:] if len(lines) > limit else lines
+        recent = _tail_lines(log_file, limit)
         
-        return jsonify({
+        return ojsonify({
             'log_file': log_file,
             'limit': limit,
-            'total_lines': len(lines),
+            'total_lines': _count_lines(log_file),
             'returned_lines': len(recent),
             'logs': recent
-        }), 200
+        })
     
     except Exception as e:
-        return jsonify({
+        return ojsonify({
             'error': str(e)
-        }), 500
+        }, 500)
@@ -0,0 +1,35 @@
+"""
+WSGI entry point for running the API under a production server.
+
+Usage:
+    PYTHONPATH=backend gunicorn -w 4 -k gthread --threads 4 -b 127.0.0.1:5000 api.wsgi:application
+
+Configuration is read from environment variables (api_server.py --serve-prod
+sets these from its command line arguments):
+    API_MODE, API_PCAP_FILE, API_INTERFACE, API_WINDOW_SIZE, API_HOST, API_PORT
+"""
+
+import os
+import sys
+from typing import Dict, Any
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from api.api_server import APIConfig, create_app
+
+
+def _load_config_from_env() -> Dict[str, Any]:
+    """Build the create_app config dict from API_* environment variables."""
+    env = os.environ
+    return {
+        'MODE': env.get('API_MODE', APIConfig.MODE),
+        'PCAP_FILE': env.get('API_PCAP_FILE', APIConfig.PCAP_FILE),
+        'INTERFACE': env.get('API_INTERFACE') or APIConfig.INTERFACE,
+        'WINDOW_SIZE': int(env.get('API_WINDOW_SIZE', APIConfig.WINDOW_SIZE)),
+        'DEBUG': False,
+        'HOST': env.get('API_HOST', APIConfig.HOST),
+        'PORT': int(env.get('API_PORT', APIConfig.PORT)),
+    }
+
+
+application = create_app(_load_config_from_env())
@@ -0,0 +1,48 @@
+"""
+Parsers for packet record fields shared by the analysis modules.
+
+Captures repeat the same timestamp strings and flag values many times, so
+the string parsers are memoized.
+"""
+
+from datetime import datetime
+from functools import lru_cache
+from typing import Any, Optional
+
+
+@lru_cache(maxsize=65536)
+def _str_to_ts(ts: str) -> Optional[float]:
+    try:
+        return float(ts)
+    except ValueError:
+        try:
+            return datetime.fromisoformat(ts).timestamp()
+        except ValueError:
+            return None
+
+
+def to_ts(ts: Any) -> Optional[float]:
+    """Epoch seconds from a numeric, numeric-string or ISO 8601 timestamp, or None."""
+    # Type checks instead of exceptions on the common float/int paths
+    t = type(ts)
+    if t is float:
+        return ts
+    if t is int:
+        return float(ts)
+    if t is str:
+        return _str_to_ts(ts)
+    if ts is None:
+        return None
+    try:
+        return float(ts)
+    except Exception:
+        return None
+
+
+@lru_cache(maxsize=1024)
+def parse_flags(flags: str) -> Optional[int]:
+    """TCP flags from a hex ('0x0012', as printed by tshark) or decimal string, or None."""
+    try:
+        return int(flags, 0)
+    except ValueError:
+        return None
@@ -1,19 +1,44 @@
-from typing import List, Dict, Any
-from collections import Counter, defaultdict
-from datetime import datetime
-import math
+from typing import List, Dict, Any, Tuple
 
+import numpy as np
 
-def _to_ts(ts):
-    if ts is None:
-        return None
+from ._fields import to_ts
+
+
+def _length(r: Dict[str, Any]) -> int:
+    length = r.get('length')
+    if length is None:
+        return 0
     try:
-        return float(ts)
+        return int(length)
     except Exception:
-        try:
-            return datetime.fromisoformat(ts).timestamp()
-        except Exception:
-            return None
+        return 0
+
+
+def _top_bytes(records: List[Dict[str, Any]], key: str, lengths: np.ndarray, n: int = 10) -> List[Tuple[str, int]]:
+    """Top n values of records[i][key] by summed lengths, like Counter.most_common(n)."""
+    index = {}
+    rows = []
+    codes = []
+    for i, r in enumerate(records):
+        value = r.get(key)
+        if value:
+            rows.append(i)
+            codes.append(index.setdefault(value, len(index)))
+    if not index:
+        return []
+
+    sums = np.bincount(codes, weights=lengths[rows], minlength=len(index))
+    candidates = np.arange(len(sums))
+    if len(sums) > n:
+        # Partial selection instead of sorting every value; anything tied
+        # with the n-th largest stays a candidate so ties resolve as before
+        threshold = np.partition(sums, -n)[-n]
+        candidates = np.flatnonzero(sums >= threshold)
+    # Stable sort keeps first-seen order on ties, as most_common does
+    order = candidates[np.argsort(-sums[candidates], kind='stable')][:n]
+    values = list(index)
+    return [(values[i], int(sums[i])) for i in order]
 
 
 def compute_bandwidth_metrics(records: List[Dict[str, Any]]) -> Dict[str, Any]:
@@ -29,34 +54,18 @@ def compute_bandwidth_metrics(records: List[Dict[str, Any]]) -> Dict[str, Any]:
       - top_src_bytes (list of (src_ip, bytes))
       - top_dst_bytes (list of (dst_ip, bytes))
     """
-    total_bytes = 0
-    total_packets = 0
-    times = []
-    src_bytes = Counter()
-    dst_bytes = Counter()
+    lengths = np.fromiter((_length(r) for r in records), dtype=np.int64, count=len(records))
+    times = np.fromiter(
+        (ts for ts in (to_ts(r.get('timestamp')) for r in records) if ts is not None),
+        dtype=np.float64
+    )
 
-    for r in records:
-        size = 0
-        try:
-            if r.get('length') is not None:
-                size = int(r.get('length'))
-        except Exception:
-            size = 0
-        total_bytes += size
-        total_packets += 1
-
-        if r.get('src_ip'):
-            src_bytes[r['src_ip']] += size
-        if r.get('dst_ip'):
-            dst_bytes[r['dst_ip']] += size
-
-        ts = _to_ts(r.get('timestamp'))
-        if ts is not None:
-            times.append(ts)
+    total_bytes = int(lengths.sum())
+    total_packets = len(records)
 
     duration = None
-    if times:
-        duration = max(times) - min(times) if len(times) > 1 else 0.0
+    if times.size:
+        duration = float(times.max() - times.min())
 
     avg_bps = None
     avg_pps = None
@@ -70,8 +79,8 @@ def compute_bandwidth_metrics(records: List[Dict[str, Any]]) -> Dict[str, Any]:
         'duration_s': duration,
         'avg_bps': avg_bps,
         'avg_pps': avg_pps,
-        'top_src_bytes': src_bytes.most_common(10),
-        'top_dst_bytes': dst_bytes.most_common(10),
+        'top_src_bytes': _top_bytes(records, 'src_ip', lengths),
+        'top_dst_bytes': _top_bytes(records, 'dst_ip', lengths),
     }
 
 
@@ -81,41 +90,44 @@ def compute_bandwidth_per_window(records: List[Dict[str, Any]], window_seconds:
 
     Returns a list of metric dicts with keys: window_start, window_end, total_bytes, total_packets, avg_bps, avg_pps
     """
-    norm = []
+    if window_seconds <= 0:
+        raise ValueError('window_seconds must be positive')
+
+    # Timestamps and sizes go into parallel arrays; records are never copied
+    times = []
+    sizes = []
     for r in records:
-        ts = _to_ts(r.get('timestamp'))
+        ts = to_ts(r.get('timestamp'))
         if ts is None:
             continue
-        r2 = dict(r)
-        r2['_ts'] = ts
-        norm.append(r2)
+        times.append(ts)
+        sizes.append(int(r.get('length') or 0) if r.get('length') is not None else 0)
 
-    if not norm:
+    if not times:
         return []
 
-    norm.sort(key=lambda x: x['_ts'])
-    start = norm[0]['_ts']
-    end = norm[-1]['_ts']
+    times = np.asarray(times, dtype=np.float64)
+    start = float(times.min())
+    end = float(times.max())
 
-    windows = []
-    window_start = start
-    while window_start <= end:
-        window_end = window_start + window_seconds
-        bucket = [r for r in norm if window_start <= r['_ts'] < window_end]
-        total_bytes = sum(int(r.get('length') or 0) if r.get('length') is not None else 0 for r in bucket)
-        total_packets = len(bucket)
-        avg_bps = (total_bytes / window_seconds) if window_seconds > 0 else None
-        avg_pps = (total_packets / window_seconds) if window_seconds > 0 else None
+    # Each record lands directly in its window's bucket
+    n_windows = int((end - start) // window_seconds) + 1
+    idx = ((times - start) // window_seconds).astype(np.int64)
+    bytes_per_window = np.bincount(idx, weights=np.asarray(sizes, dtype=np.float64), minlength=n_windows)
+    packets_per_window = np.bincount(idx, minlength=n_windows)
 
+    windows = []
+    for i in range(n_windows):
+        window_start = start + i * window_seconds
+        total_bytes = int(bytes_per_window[i])
+        total_packets = int(packets_per_window[i])
         windows.append({
             'window_start': window_start,
-            'window_end': window_end,
+            'window_end': window_start + window_seconds,
             'total_bytes': total_bytes,
             'total_packets': total_packets,
-            'avg_bps': avg_bps,
-            'avg_pps': avg_pps,
+            'avg_bps': total_bytes / window_seconds,
+            'avg_pps': total_packets / window_seconds,
         })
 
-        window_start = window_end
-
     return windows
@@ -1,19 +1,7 @@
 from typing import List, Dict, Any
 from collections import defaultdict
-from datetime import datetime
-import math
 
-
-def _to_ts(ts):
-    if ts is None:
-        return None
-    try:
-        return float(ts)
-    except Exception:
-        try:
-            return datetime.fromisoformat(ts).timestamp()
-        except Exception:
-            return None
+from ._fields import to_ts
 
 
 def _flow_key(rec: Dict[str, Any]):
@@ -39,7 +27,7 @@ def compute_connection_metrics(records: List[Dict[str, Any]], timeout: float = 1
     # organize records by time
     recs = []
     for r in records:
-        ts = _to_ts(r.get('timestamp'))
+        ts = to_ts(r.get('timestamp'))
         if ts is None:
             continue
         r2 = dict(r)
@@ -9,189 +9,348 @@ Produces per-flow statistics including:
 - Retransmission counts (for packet loss detection)
 - Connection state tracking (established, reset, etc.)
 
+Packets are read with a single streaming tshark pass (tshark must be on PATH).
+
 Used by:
 - scan_detector.py (port scanning detection)
 - packet_loss_detection.py (reliability monitoring)
 """
 
-import pyshark
-from typing import Dict, List, Any, Set, Tuple
-from collections import defaultdict
+import functools
+import multiprocessing as mp
+import os
+import subprocess
+import tempfile
+from typing import Dict, Iterable, Iterator, List, Any, Optional, Set, Tuple
+
+import numpy as np
+import orjson
+
+from ._fields import parse_flags
+
+TSHARK_BIN = 'tshark'
+EDITCAP_BIN = 'editcap'
+
+# Packets per chunk when extract_flows_parallel splits a capture with editcap
+PARALLEL_CHUNK_PACKETS = 200_000
+
+# Retransmission detection: 'last_seq' flags a sequence number repeated by
+# the flow's previous segment; 'seen' flags any sequence number the flow has
+# already sent, which also catches retransmissions after reordering (at the
+# cost of keeping a set of sequence numbers per flow)
+RETRANS_METHODS = ('last_seq', 'seen')
+
+# Only the fields FlowEnricher consumes are requested from tshark
+TSHARK_FIELDS = (
+    'ip.src', 'ip.dst', 'ipv6.src', 'ipv6.dst',
+    'tcp.srcport', 'tcp.dstport', 'tcp.flags', 'tcp.seq', 'tcp.len',
+    'udp.srcport', 'udp.dstport', 'udp.length',
+)
+
+# (src_ip, src_port, dst_ip, dst_port, protocol), with ports as tshark
+# printed them: packets are bucketed on the raw strings and the ports are
+# converted to int once per flow rather than once per packet
+FlowKey = Tuple[str, str, str, str, str]
+
+# (flow_key, flags, seq, length)
+PacketTuple = Tuple[FlowKey, Optional[int], Optional[int], int]
+
+# TCP flag values counted per flow (exact values: a SYN-ACK is neither)
+TCP_SYN = 0x02
+TCP_ACK = 0x10
+TCP_RST = 0x04
+TCP_FIN = 0x01
+
+
+def _first(layers: Dict[str, Any], name: str) -> Optional[str]:
+    """First value of an ek field (tshark emits -e fields as lists)."""
+    value = layers.get(name)
+    if isinstance(value, list):
+        return value[0] if value else None
+    return value
+
+
+def _packet_from_layers(layers: Dict[str, Any]) -> Optional[PacketTuple]:
+    """Flow fields of one packet from its ek "layers" object, or None if not TCP/UDP over IP."""
+    if 'ip_src' in layers:
+        src_ip = _first(layers, 'ip_src')
+        dst_ip = _first(layers, 'ip_dst')
+    elif 'ipv6_src' in layers:
+        src_ip = _first(layers, 'ipv6_src')
+        dst_ip = _first(layers, 'ipv6_dst')
+    else:
+        return None
+    
+    flags = None
+    seq = None
+    if 'tcp_srcport' in layers:
+        protocol = 'TCP'
+        src_port = _first(layers, 'tcp_srcport')
+        dst_port = _first(layers, 'tcp_dstport')
+        flags = _first(layers, 'tcp_flags')
+        if flags is not None:
+            flags = parse_flags(flags)
+        seq = _first(layers, 'tcp_seq')
+        length = _first(layers, 'tcp_len')
+    elif 'udp_srcport' in layers:
+        protocol = 'UDP'
+        src_port = _first(layers, 'udp_srcport')
+        dst_port = _first(layers, 'udp_dstport')
+        length = _first(layers, 'udp_length')
+    else:
+        return None
+    
+    if src_port is None or dst_port is None:
+        return None
+    
+    return (
+        (src_ip, src_port, dst_ip, dst_port, protocol),
+        flags,
+        int(seq) if seq is not None else None,
+        int(length) if length is not None else 0,
+    )
+
+
+def iter_packets(pcap_path: str) -> Iterator[PacketTuple]:
+    """
+    Stream the flow fields of every TCP/UDP packet in a PCAP.
+    
+    Runs tshark once with Elasticsearch-style JSON output (-T ek), restricted
+    to TSHARK_FIELDS, and parses one packet per line. This avoids pyshark's
+    per-packet dissection tree and attribute lookups entirely.
+    """
+    # Absolute sequence numbers: retransmission detection only compares them
+    # for equality, and they stay comparable across editcap chunks
+    cmd = [TSHARK_BIN, '-r', pcap_path, '-n', '-o', 'tcp.relative_sequence_numbers:FALSE',
+           '-T', 'ek', '-Y', 'tcp or udp']
+    for field in TSHARK_FIELDS:
+        cmd += ['-e', field]
+    
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL,
+                          bufsize=1 << 20) as proc:
+        for line in proc.stdout:
+            # ek interleaves a bulk-index header line before each packet
+            if line.startswith(b'{"index"'):
+                continue
+            packet = _packet_from_layers(orjson.loads(line).get('layers', {}))
+            if packet is not None:
+                yield packet
+    
+    if proc.returncode != 0:
+        raise RuntimeError(f"tshark exited with status {proc.returncode}")
+
+
+class _FlowCounters:
+    """Mutable per-flow counters; slot attributes are cheaper to bump per packet than dict keys."""
+    
+    __slots__ = ('packet_count', 'byte_count', 'syn_count', 'ack_count', 'rst_count',
+                 'fin_count', 'retransmission_count', 'first_seq', 'last_seq', 'seen_seqs')
+    
+    def __init__(self, track_seen: bool = False):
+        self.packet_count = 0
+        self.byte_count = 0
+        self.syn_count = 0
+        self.ack_count = 0
+        self.rst_count = 0
+        self.fin_count = 0
+        self.retransmission_count = 0
+        self.first_seq = None
+        self.last_seq = None
+        self.seen_seqs: Optional[Set[int]] = set() if track_seen else None
+    
+    def merge(self, later: '_FlowCounters') -> None:
+        """Fold in the counters of the same flow from the next chunk of the capture."""
+        self.packet_count += later.packet_count
+        self.byte_count += later.byte_count
+        self.syn_count += later.syn_count
+        self.ack_count += later.ack_count
+        self.rst_count += later.rst_count
+        self.fin_count += later.fin_count
+        self.retransmission_count += later.retransmission_count
+        if self.seen_seqs is not None:
+            # Sequence numbers first sent in the later chunk but already seen here
+            self.retransmission_count += len(self.seen_seqs & later.seen_seqs)
+            self.seen_seqs |= later.seen_seqs
+        elif later.first_seq is not None and self.last_seq == later.first_seq:
+            # A repeat that straddles the chunk boundary
+            self.retransmission_count += 1
+        if later.first_seq is not None:
+            if self.first_seq is None:
+                self.first_seq = later.first_seq
+            self.last_seq = later.last_seq
+    
+    def as_dict(self, flow_key: FlowKey) -> Dict[str, Any]:
+        """The public flow record for this flow."""
+        src_ip, src_port, dst_ip, dst_port, protocol = flow_key
+        return {
+            'src_ip': src_ip,
+            'src_port': int(src_port),
+            'dst_ip': dst_ip,
+            'dst_port': int(dst_port),
+            'protocol': protocol,
+            'packet_count': self.packet_count,
+            'byte_count': self.byte_count,
+            'syn_count': self.syn_count,
+            'ack_count': self.ack_count,
+            'rst_count': self.rst_count,
+            'fin_count': self.fin_count,
+            'retransmission_count': self.retransmission_count,
+            'last_seq': self.last_seq,
+            'last_ack': None,
+        }
+
+
+def _count_flows(packets: Iterable[PacketTuple],
+                 retrans_method: str = 'last_seq') -> Dict[FlowKey, _FlowCounters]:
+    """Accumulate per-flow counters over a packet stream, in first-seen flow order."""
+    track_seen = retrans_method == 'seen'
+    flow_map = {}  # FlowKey -> _FlowCounters
+    for flow_key, flags, seq, length in packets:
+        flow = flow_map.get(flow_key)
+        if flow is None:
+            flow = flow_map[flow_key] = _FlowCounters(track_seen)
+        
+        # Update flow statistics
+        flow.packet_count += 1
+        flow.byte_count += length
+        
+        # Track TCP flags for scan detection
+        if flags:
+            if flags == TCP_SYN:
+                flow.syn_count += 1
+            elif flags == TCP_ACK:
+                flow.ack_count += 1
+            elif flags == TCP_RST:
+                flow.rst_count += 1
+            elif flags == TCP_FIN:
+                flow.fin_count += 1
+        
+        # Detect retransmissions (same sequence number sent twice)
+        if seq is not None:
+            if track_seen:
+                if seq in flow.seen_seqs:
+                    flow.retransmission_count += 1
+                else:
+                    flow.seen_seqs.add(seq)
+            elif flow.last_seq == seq:
+                flow.retransmission_count += 1
+            if flow.first_seq is None:
+                flow.first_seq = seq
+            flow.last_seq = seq
+    return flow_map
+
+
+def _count_chunk_flows(pcap_path: str, retrans_method: str = 'last_seq') -> Dict[FlowKey, _FlowCounters]:
+    """Pool worker: flow counters of one editcap chunk."""
+    return _count_flows(iter_packets(pcap_path), retrans_method)
 
 
 class FlowEnricher:
     """Extract per-flow metrics from PCAP data for advanced detection."""
     
-    def __init__(self, pcap_path: str):
+    def __init__(self, pcap_path: str, retrans_method: str = 'last_seq'):
         """
         Initialize flow enricher.
         
         Args:
             pcap_path: Path to PCAP file
+            retrans_method: Retransmission detection, one of RETRANS_METHODS
         """
+        if retrans_method not in RETRANS_METHODS:
+            raise ValueError(f"retrans_method must be one of {RETRANS_METHODS}, got {retrans_method!r}")
         self.pcap_path = pcap_path
+        self.retrans_method = retrans_method
+        self._flows_cache: Optional[List[Dict[str, Any]]] = None
+    
+    def invalidate(self) -> None:
+        """Forget extracted flows so the next call re-reads the PCAP."""
+        self._flows_cache = None
     
     def extract_flows(self) -> List[Dict[str, Any]]:
         """
         Extract all flows from PCAP and return list of flow records.
         
+        The PCAP is read once per enricher; later calls (e.g. from both
+        aggregations below) reuse the result until invalidate() is called.
+        
         Returns:
             List of flow dicts with src_ip, dst_ip, src_port, dst_port, etc.
         """
+        if self._flows_cache is not None:
+            return self._flows_cache
+        
         flows = []
-        flow_map = {}  # (src_ip, src_port, dst_ip, dst_port, protocol) -> flow data
         
         try:
-            cap = pyshark.FileCapture(
-                self.pcap_path,
-                use_json=True,
-                keep_packets=False,
-                only_summaries=False
-            )
-            
-            for packet in cap:
-                flow_data = self._extract_flow_from_packet(packet)
-                if not flow_data:
-                    continue
-                
-                # Use 5-tuple as flow key (src_ip, src_port, dst_ip, dst_port, protocol)
-                flow_key = (
-                    flow_data.get('src_ip'),
-                    flow_data.get('src_port'),
-                    flow_data.get('dst_ip'),
-                    flow_data.get('dst_port'),
-                    flow_data.get('protocol')
-                )
-                
-                if flow_key not in flow_map:
-                    flow_map[flow_key] = {
-                        'src_ip': flow_data['src_ip'],
-                        'src_port': flow_data['src_port'],
-                        'dst_ip': flow_data['dst_ip'],
-                        'dst_port': flow_data['dst_port'],
-                        'protocol': flow_data['protocol'],
-                        'packet_count': 0,
-                        'byte_count': 0,
-                        'syn_count': 0,
-                        'ack_count': 0,
-                        'rst_count': 0,
-                        'fin_count': 0,
-                        'retransmission_count': 0,
-                        'last_seq': None,
-                        'last_ack': None,
-                    }
-                
-                # Update flow statistics
-                flow = flow_map[flow_key]
-                flow['packet_count'] += 1
-                flow['byte_count'] += flow_data.get('length', 0)
-                
-                # Track TCP flags for scan detection
-                if flow_data.get('flags'):
-                    flags = flow_data['flags']
-                    if 'SYN' in flags or flags == '0x0002':
-                        flow['syn_count'] += 1
-                    if 'ACK' in flags or '0x0010' in flags:
-                        flow['ack_count'] += 1
-                    if 'RST' in flags or flags == '0x0004':
-                        flow['rst_count'] += 1
-                    if 'FIN' in flags or flags == '0x0001':
-                        flow['fin_count'] += 1
-                
-                # Detect retransmissions (same sequence number sent twice)
-                if flow_data.get('seq') is not None:
-                    if flow['last_seq'] == flow_data['seq']:
-                        flow['retransmission_count'] += 1
-                    flow['last_seq'] = flow_data['seq']
-            
-            cap.close()
-            flows = list(flow_map.values())
+            flow_map = _count_flows(iter_packets(self.pcap_path), self.retrans_method)
+            flows = [flow.as_dict(flow_key) for flow_key, flow in flow_map.items()]
+            self._flows_cache = flows
         
         except Exception as e:
             print(f"Error extracting flows: {e}")
         
         return flows
     
-    def _extract_flow_from_packet(self, packet) -> Dict[str, Any]:
+    def extract_flows_parallel(self, n_workers: Optional[int] = None,
+                               chunk_packets: int = PARALLEL_CHUNK_PACKETS) -> List[Dict[str, Any]]:
         """
-        Extract flow information from a single packet.
+        Same result as extract_flows(), using several tshark processes.
         
-        Returns:
-            Dict with src_ip, dst_ip, src_port, dst_port, protocol, flags, seq, etc.
-            or None if not a TCP/UDP packet
+        The capture is split into chunks of chunk_packets with editcap, each
+        chunk is dissected in its own worker, and the per-chunk counters are
+        merged in capture order (a repeated sequence number that straddles
+        two chunks is still counted as a retransmission).
+        
+        Args:
+            n_workers: Worker processes (default: CPU count)
+            chunk_packets: Packets per editcap chunk
         """
+        if self._flows_cache is not None:
+            return self._flows_cache
+        
+        flows = []
+        
         try:
-            # Get IP layer
-            if 'IP' in packet:
-                ip_layer = packet['IP']
-                src_ip = ip_layer.src
-                dst_ip = ip_layer.dst
-            elif 'IPv6' in packet:
-                ip_layer = packet['IPv6']
-                src_ip = ip_layer.src
-                dst_ip = ip_layer.dst
-            else:
-                return None
-            
-            # Get protocol-specific info
-            protocol = None
-            src_port = None
-            dst_port = None
-            flags = None
-            seq = None
-            ack = None
-            length = 0
-            
-            if 'TCP' in packet:
-                tcp_layer = packet['TCP']
-                protocol = 'TCP'
-                src_port = int(tcp_layer.srcport) if hasattr(tcp_layer, 'srcport') else None
-                dst_port = int(tcp_layer.dstport) if hasattr(tcp_layer, 'dstport') else None
-                
-                # Extract TCP flags
-                if hasattr(tcp_layer, 'flags'):
-                    flags = tcp_layer.flags
-                
-                # Extract sequence numbers for retransmission detection
-                if hasattr(tcp_layer, 'seq'):
-                    seq = int(tcp_layer.seq)
-                if hasattr(tcp_layer, 'ack'):
-                    ack = int(tcp_layer.ack)
+            with tempfile.TemporaryDirectory(prefix='flow_chunks_') as tmp_dir:
+                subprocess.run(
+                    [EDITCAP_BIN, '-c', str(chunk_packets), self.pcap_path,
+                     os.path.join(tmp_dir, 'chunk.pcapng')],
+                    stdout=subprocess.DEVNULL,
+                    stderr=subprocess.DEVNULL,
+                    check=True
+                )
+                # editcap numbers its output files, so name order is capture order
+                chunks = [os.path.join(tmp_dir, name) for name in sorted(os.listdir(tmp_dir))]
                 
-                length = int(tcp_layer.len) if hasattr(tcp_layer, 'len') else 0
-            
-            elif 'UDP' in packet:
-                udp_layer = packet['UDP']
-                protocol = 'UDP'
-                src_port = int(udp_layer.srcport) if hasattr(udp_layer, 'srcport') else None
-                dst_port = int(udp_layer.dstport) if hasattr(udp_layer, 'dstport') else None
-                length = int(udp_layer.len) if hasattr(udp_layer, 'len') else 0
-            
-            else:
-                return None
+                flow_map = {}
+                with mp.Pool(n_workers) as pool:
+                    count_chunk = functools.partial(_count_chunk_flows, retrans_method=self.retrans_method)
+                    for chunk_flows in pool.imap(count_chunk, chunks):
+                        for flow_key, counters in chunk_flows.items():
+                            flow = flow_map.get(flow_key)
+                            if flow is None:
+                                flow_map[flow_key] = counters
+                            else:
+                                flow.merge(counters)
             
-            if not protocol or src_port is None or dst_port is None:
-                return None
-            
-            return {
-                'src_ip': src_ip,
-                'dst_ip': dst_ip,
-                'src_port': src_port,
-                'dst_port': dst_port,
-                'protocol': protocol,
-                'flags': flags,
-                'seq': seq,
-                'ack': ack,
-                'length': length,
-            }
+            flows = [flow.as_dict(flow_key) for flow_key, flow in flow_map.items()]
+            self._flows_cache = flows
+        
+        except Exception as e:
+            print(f"Error extracting flows: {e}")
         
-        except Exception:
-            return None
+        return flows
     
-    def extract_source_port_scan_activity(self) -> List[Dict[str, Any]]:
+    def extract_source_port_scan_activity(self, flows: Optional[List[Dict[str, Any]]] = None,
+                                          min_syn_count: int = 0) -> List[Dict[str, Any]]:
         """
         Extract per-source-IP statistics for port scan detection.
         
+        Args:
+            flows: Already-extracted flows (default: self.extract_flows())
+            min_syn_count: Only report sources that sent at least this many
+                SYNs; the port lists of other sources are never built
+        
         Returns:
             List of records:
             {
@@ -203,42 +362,58 @@ class FlowEnricher:
               'has_responses': bool (if any ACKs received)
             }
         """
-        flows = self.extract_flows()
+        if flows is None:
+            flows = self.extract_flows()
         
-        # Aggregate by source IP
-        src_stats = defaultdict(lambda: {
-            'syn_count': 0,
-            'dst_ports': set(),
-            'total_packets': 0,
-            'has_responses': False,
-        })
+        if not flows:
+            return []
         
-        for flow in flows:
-            src_ip = flow['src_ip']
-            src_stats[src_ip]['syn_count'] += flow['syn_count']
-            src_stats[src_ip]['dst_ports'].add(flow['dst_port'])
-            src_stats[src_ip]['total_packets'] += flow['packet_count']
-            if flow['ack_count'] > 0:
-                src_stats[src_ip]['has_responses'] = True
+        # Aggregate by source IP: each source gets a dense first-seen code and
+        # per-source totals are accumulated with bincount
+        src_index = {}
+        n = len(flows)
+        codes = np.fromiter((src_index.setdefault(f['src_ip'], len(src_index)) for f in flows),
+                            dtype=np.int64, count=n)
+        n_src = len(src_index)
+        syn_counts = np.bincount(codes, weights=np.fromiter((f['syn_count'] for f in flows), dtype=np.float64, count=n),
+                                 minlength=n_src)
+        total_packets = np.bincount(codes, weights=np.fromiter((f['packet_count'] for f in flows), dtype=np.float64, count=n),
+                                    minlength=n_src)
+        responses = np.bincount(codes, weights=np.fromiter((f['ack_count'] > 0 for f in flows), dtype=np.float64, count=n),
+                                minlength=n_src)
+        
+        # Distinct (source, port) pairs packed into one int64 (ports fit in 16
+        # bits); np.unique sorts them, so each source's ports come out grouped
+        # and in ascending order
+        ports = np.fromiter((f['dst_port'] for f in flows), dtype=np.int64, count=n)
+        pairs = np.unique((codes << 16) | ports)
+        unique_ports = np.bincount(pairs >> 16, minlength=n_src)
+        port_values = pairs & 0xFFFF
+        bounds = np.concatenate(([0], np.cumsum(unique_ports)))
         
         # Convert to list
         results = []
-        for src_ip, stats in src_stats.items():
+        for src_ip, i in src_index.items():
+            if syn_counts[i] < min_syn_count:
+                continue
             results.append({
                 'src_ip': src_ip,
-                'syn_count': stats['syn_count'],
-                'unique_dst_ports': len(stats['dst_ports']),
-                'dst_ports': sorted(list(stats['dst_ports'])),
-                'total_packets': stats['total_packets'],
-                'has_responses': stats['has_responses'],
+                'syn_count': int(syn_counts[i]),
+                'unique_dst_ports': int(unique_ports[i]),
+                'dst_ports': port_values[bounds[i]:bounds[i + 1]].tolist(),
+                'total_packets': int(total_packets[i]),
+                'has_responses': bool(responses[i]),
             })
         
         return results
     
-    def extract_retransmission_stats(self) -> List[Dict[str, Any]]:
+    def extract_retransmission_stats(self, flows: Optional[List[Dict[str, Any]]] = None) -> List[Dict[str, Any]]:
         """
         Extract per-flow retransmission statistics for packet loss detection.
         
+        Args:
+            flows: Already-extracted flows (default: self.extract_flows())
+        
         Returns:
             List of records:
             {
@@ -252,7 +427,8 @@ class FlowEnricher:
               'retransmission_rate': float (percent)
             }
         """
-        flows = self.extract_flows()
+        if flows is None:
+            flows = self.extract_flows()
         
         results = []
         for flow in flows:
@@ -285,26 +461,26 @@ def main():
     print("=" * 70)
     
     enricher = FlowEnricher(pcap_path)
+    flows = enricher.extract_flows()
     
     # Extract port scan activity
     print("\n1. Port Scan Detection Candidates:")
     print("-" * 70)
-    scan_activity = enricher.extract_source_port_scan_activity()
+    scan_activity = enricher.extract_source_port_scan_activity(flows, min_syn_count=6)
     
     # Show top sources by SYN count
     scan_activity.sort(key=lambda x: x['syn_count'], reverse=True)
     for src in scan_activity[:10]:
-        if src['syn_count'] > 5:
-            print(f"  {src['src_ip']:15} — "
-                  f"SYNs: {src['syn_count']:3}, "
-                  f"Ports: {src['unique_dst_ports']:3}, "
-                  f"Packets: {src['total_packets']:5}, "
-                  f"Responses: {src['has_responses']}")
+        print(f"  {src['src_ip']:15} — "
+              f"SYNs: {src['syn_count']:3}, "
+              f"Ports: {src['unique_dst_ports']:3}, "
+              f"Packets: {src['total_packets']:5}, "
+              f"Responses: {src['has_responses']}")
     
     # Extract retransmission stats
     print("\n2. Packet Loss (Retransmission) Detection:")
     print("-" * 70)
-    retrans_stats = enricher.extract_retransmission_stats()
+    retrans_stats = enricher.extract_retransmission_stats(flows)
     
     # Show top flows by retransmission rate
     for flow in retrans_stats[:10]:
@@ -1,38 +1,32 @@
 from typing import List, Dict, Any
-import statistics
-import math
-from datetime import datetime
 
+import numpy as np
 
-def _to_ts(ts):
-    if ts is None:
-        return None
-    try:
-        return float(ts)
-    except Exception:
-        try:
-            return datetime.fromisoformat(ts).timestamp()
-        except Exception:
-            return None
+from ._fields import parse_flags, to_ts
 
 
 def _percentiles(data, percentiles=(50, 90, 99)):
-    if not data:
+    if len(data) == 0:
         return {p: None for p in percentiles}
-    data_sorted = sorted(data)
-    n = len(data_sorted)
-    res = {}
-    for p in percentiles:
-        k = (p / 100) * (n - 1)
-        f = math.floor(k)
-        c = math.ceil(k)
-        if f == c:
-            res[p] = data_sorted[int(k)]
-        else:
-            d0 = data_sorted[int(f)] * (c - k)
-            d1 = data_sorted[int(c)] * (k - f)
-            res[p] = d0 + d1
-    return res
+    # Linear interpolation between closest ranks, all percentiles in one call
+    values = np.percentile(np.asarray(data, dtype=np.float64), percentiles, method='linear')
+    return {p: float(v) for p, v in zip(percentiles, values)}
+
+
+def _latency_stats(samples: List[float], sample_key: str) -> Dict[str, Any]:
+    """count/mean/median/percentiles of latency samples plus the first 100 raw samples."""
+    stats = {'count': len(samples)}
+    if samples:
+        arr = np.asarray(samples, dtype=np.float64)
+        stats['mean'] = float(arr.mean())
+        stats['median'] = float(np.median(arr))
+        stats['percentiles'] = _percentiles(arr, (50, 90, 99))
+        stats[sample_key] = samples[:100]
+    else:
+        stats['mean'] = stats['median'] = None
+        stats['percentiles'] = {50: None, 90: None, 99: None}
+        stats[sample_key] = []
+    return stats
 
 
 def estimate_tcp_rtt(records: List[Dict[str, Any]], max_window: float = 5.0) -> Dict[str, Any]:
@@ -49,16 +43,12 @@ def estimate_tcp_rtt(records: List[Dict[str, Any]], max_window: float = 5.0) ->
         flags = r.get('flags')
         if flags is None:
             continue
-        # parse hex or decimal
-        try:
-            f = int(str(flags), 0)
-        except Exception:
-            # try to extract hex digits
-            try:
-                f = int(str(flags).strip(), 0)
-            except Exception:
-                continue
-        ts = _to_ts(r.get('timestamp'))
+        f = flags if type(flags) is int else parse_flags(str(flags))
+        # Only SYN and SYN-ACK packets matter; skip everything else before
+        # paying for timestamp and address handling
+        if f is None or not f & 0x02:
+            continue
+        ts = to_ts(r.get('timestamp'))
         if ts is None:
             continue
         src = r.get('src_ip')
@@ -85,19 +75,7 @@ def estimate_tcp_rtt(records: List[Dict[str, Any]], max_window: float = 5.0) ->
                 if 0 <= (ts - t_syn) <= max_window:
                     rtts.append(ts - t_syn)
 
-    stats = {}
-    stats['count'] = len(rtts)
-    if rtts:
-        stats['mean'] = statistics.mean(rtts)
-        stats['median'] = statistics.median(rtts)
-        stats['percentiles'] = _percentiles(rtts, (50, 90, 99))
-        stats['sample_rtts'] = rtts[:100]
-    else:
-        stats['mean'] = stats['median'] = None
-        stats['percentiles'] = {50: None, 90: None, 99: None}
-        stats['sample_rtts'] = []
-
-    return stats
+    return _latency_stats(rtts, 'sample_rtts')
 
 
 def estimate_request_response(records: List[Dict[str, Any]], max_window: float = 5.0) -> Dict[str, Any]:
@@ -111,19 +89,20 @@ def estimate_request_response(records: List[Dict[str, Any]], max_window: float =
     pending = {}
     latencies = []
 
-    # sort records by timestamp
-    recs = []
-    for r in records:
-        ts = _to_ts(r.get('timestamp'))
+    # order records by timestamp via an index sort (records are never copied)
+    times = []
+    rows = []
+    for i, r in enumerate(records):
+        ts = to_ts(r.get('timestamp'))
         if ts is None:
             continue
-        r2 = dict(r)
-        r2['_ts'] = ts
-        recs.append(r2)
-    recs.sort(key=lambda x: x['_ts'])
+        times.append(ts)
+        rows.append(i)
+    order = np.argsort(np.asarray(times, dtype=np.float64), kind='stable').tolist()
 
-    for r in recs:
-        ts = r['_ts']
+    for j in order:
+        r = records[rows[j]]
+        ts = times[j]
         src = r.get('src_ip')
         dst = r.get('dst_ip')
         sport = r.get('src_port')
@@ -146,18 +125,7 @@ def estimate_request_response(records: List[Dict[str, Any]], max_window: float =
         if key not in pending:
             pending[key] = ts
 
-    stats = {'count': len(latencies)}
-    if latencies:
-        stats['mean'] = statistics.mean(latencies)
-        stats['median'] = statistics.median(latencies)
-        stats['percentiles'] = _percentiles(latencies, (50, 90, 99))
-        stats['sample_latencies'] = latencies[:100]
-    else:
-        stats['mean'] = stats['median'] = None
-        stats['percentiles'] = {50: None, 90: None, 99: None}
-        stats['sample_latencies'] = []
-
-    return stats
+    return _latency_stats(latencies, 'sample_latencies')
 
 
 def compute_latency_metrics(records: List[Dict[str, Any]], max_window: float = 5.0) -> Dict[str, Any]:
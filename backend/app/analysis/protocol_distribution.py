@@ -13,25 +13,19 @@ def compute_protocol_distribution(records: List[Dict[str, Any]], key_candidates:
     Returns:
         dict with counts, percentages, total, and top_protocols (list of (proto, count, pct)).
     """
-    total = 0
-    counter = Counter()
-
-    for r in records:
-        proto = None
+    def category(r: Dict[str, Any]) -> str:
         for k in key_candidates:
             v = r.get(k)
             if v is not None:
-                proto = str(v)
-                break
-        if proto is None:
-            # fallback heuristics
-            if r.get('src_port') or r.get('dst_port'):
-                proto = 'transport'
-            else:
-                proto = 'unknown'
-
-        counter[proto] += 1
-        total += 1
+                return v if type(v) is str else str(v)
+        # fallback heuristics
+        if r.get('src_port') or r.get('dst_port'):
+            return 'transport'
+        return 'unknown'
+
+    # Counter counts an iterable in C; only the key extraction stays in Python
+    counter = Counter(map(category, records))
+    total = sum(counter.values())
 
     if total == 0:
         return {'total': 0, 'counts': {}, 'percentages': {}, 'top_protocols': []}
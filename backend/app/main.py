@@ -1,6 +1,7 @@
 import logging
 import os
 import json
+from collections import Counter
 from typing import Dict, List, Any
 from datetime import datetime
 
@@ -89,21 +90,18 @@ def log_anomaly_window_summary(
     if not anomalies:
         return
     
-    # Count by severity
-    high_count = sum(1 for a in anomalies if a.get('severity') == 'high')
-    medium_count = sum(1 for a in anomalies if a.get('severity') == 'medium')
-    
-    # Count by type
-    by_type = {}
+    # Count by severity and by type in one pass
+    by_severity = Counter()
+    by_type = Counter()
     for a in anomalies:
-        atype = a.get('type', 'unknown')
-        by_type[atype] = by_type.get(atype, 0) + 1
+        by_severity[a.get('severity')] += 1
+        by_type[a.get('type', 'unknown')] += 1
     
     # Build summary message
     types_str = ', '.join([f"{t}({c})" for t, c in by_type.items()])
     summary_msg = (
         f"[W{window_num}] [SUMMARY] {len(anomalies)} anomalies detected: "
-        f"HIGH={high_count}, MEDIUM={medium_count} | Types: {types_str}"
+        f"HIGH={by_severity['high']}, MEDIUM={by_severity['medium']} | Types: {types_str}"
     )
     
     logger.warning(summary_msg)
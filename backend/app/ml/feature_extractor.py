@@ -6,7 +6,7 @@ Converts raw network metrics into numerical features for machine learning.
 """
 
 import numpy as np
-from typing import List, Dict, Any, Tuple, Optional
+from typing import List, Dict, Any, Iterable, Iterator, Sized, Tuple, Optional
 
 
 class FeatureExtractor:
@@ -31,25 +31,27 @@ class FeatureExtractor:
     
     def extract_features(self, metric_window: Dict[str, Any]) -> np.ndarray:
         """Extract features from a single metric window."""
-        features = []
-        
+        return np.array(self._feature_row(metric_window), dtype=np.float64)
+    
+    def _feature_row(self, metric_window: Dict[str, Any]) -> Tuple[float, ...]:
+        """Extract the feature values of one metric window as a tuple of floats."""
         # Bandwidth metrics
         bandwidth = metric_window.get('bandwidth', {})
-        features.append(self._get_value(bandwidth, 'avg_bps', 0))
-        features.append(self._get_value(bandwidth, 'avg_pps', 0))
+        bps = self._get_value(bandwidth, 'avg_bps', 0)
+        pps = self._get_value(bandwidth, 'avg_pps', 0)
         
         # Latency metrics
         latency = metric_window.get('latency', {})
         req_resp = self._get_value(latency, 'request_response', {})
-        features.append(self._get_value(req_resp, 'mean', 0))
-        features.append(self._get_value(req_resp.get('percentiles', {}), '99', 0))
+        rr_mean = self._get_value(req_resp, 'mean', 0)
+        rr_p99 = self._get_value(req_resp.get('percentiles', {}), '99', 0)
         
         tcp_rtt = self._get_value(latency, 'tcp_rtt', {})
-        features.append(self._get_value(tcp_rtt, 'mean', 0))
+        rtt_mean = self._get_value(tcp_rtt, 'mean', 0)
         
         # Connection metrics
         connections = metric_window.get('connections', {})
-        features.append(self._get_value(connections, 'active_connections', 0))
+        active = self._get_value(connections, 'active_connections', 0)
         
         # Protocol distribution
         protocol = metric_window.get('protocol', {})
@@ -64,16 +66,27 @@ class FeatureExtractor:
             udp_pct = (udp_pct / total) * 100
             icmp_pct = (icmp_pct / total) * 100
         
-        features.append(tcp_pct)
-        features.append(udp_pct)
-        features.append(icmp_pct)
-        
         # Packet size
-        features.append(self._get_value(bandwidth, 'avg_packet_size', 0))
+        pkt_size = self._get_value(bandwidth, 'avg_packet_size', 0)
         
-        return np.array(features, dtype=np.float64)
+        return (
+            float(bps), float(pps),
+            float(rr_mean), float(rr_p99), float(rtt_mean),
+            float(active),
+            float(tcp_pct), float(udp_pct), float(icmp_pct),
+            float(pkt_size),
+        )
     
-    def extract_batch(self, metric_windows: List[Dict[str, Any]],
+    def _feature_rows(self, metric_windows: Iterable[Dict[str, Any]]) -> Iterator[float]:
+        """Yield feature values window by window; unparseable windows yield NaNs."""
+        invalid = (np.nan,) * len(self.FEATURES)
+        for window in metric_windows:
+            try:
+                yield from self._feature_row(window)
+            except Exception:
+                yield from invalid
+    
+    def extract_batch(self, metric_windows: Iterable[Dict[str, Any]],
                      sample_rate: Optional[float] = None,
                      sampling_strategy: str = 'uniform'
                      ) -> Tuple[np.ndarray, List[int], Dict[str, Any]]:
@@ -81,7 +94,8 @@ class FeatureExtractor:
         Extract features from multiple metric windows with optional sampling.
         
         Args:
-            metric_windows: List of metric window dicts
+            metric_windows: Metric window dicts; a list, or any iterable (e.g. a
+                stream straight from the JSONL file) which is consumed once
             sample_rate: Fraction of data to use (0.0-1.0). None = use all data.
             sampling_strategy: 'uniform', 'stratified', or 'systematic'
                 - uniform: random sampling
@@ -93,25 +107,52 @@ class FeatureExtractor:
             valid_indices: Original indices of selected samples
             stats: Dict with sampling info {total_windows, selected_samples, sample_rate_actual, strategy}
         """
-        features_list = []
-        valid_indices_full = []
+        return self.sample_features(
+            self.extract_all(metric_windows),
+            sample_rate=sample_rate,
+            sampling_strategy=sampling_strategy
+        )
+    
+    def extract_all(self, metric_windows: Iterable[Dict[str, Any]]) -> np.ndarray:
+        """
+        Extract the raw feature row of every window, without filtering or sampling.
         
-        # First pass: extract all valid features
-        for i, window in enumerate(metric_windows):
-            try:
-                features = self.extract_features(window)
-                if np.isfinite(features).all() and np.any(features != 0):
-                    features_list.append(features)
-                    valid_indices_full.append(i)
-            except Exception:
-                continue
+        Windows that cannot be parsed produce a row of NaNs, so row i always
+        corresponds to window i. Pass the result to sample_features().
+        """
+        n_features = len(self.FEATURES)
+        
+        # Extract all features straight into one contiguous buffer
+        # (preallocated when the length is known, grown as needed for streams)
+        return np.fromiter(
+            self._feature_rows(metric_windows),
+            dtype=np.float64,
+            count=len(metric_windows) * n_features if isinstance(metric_windows, Sized) else -1
+        ).reshape(-1, n_features)
+    
+    def sample_features(self, X_all: np.ndarray,
+                        sample_rate: Optional[float] = None,
+                        sampling_strategy: str = 'uniform'
+                        ) -> Tuple[np.ndarray, List[int], Dict[str, Any]]:
+        """
+        Drop invalid rows from an extract_all() matrix and apply sampling.
         
-        if not features_list:
+        Arguments and return value are as for extract_batch().
+        """
+        n_features = len(self.FEATURES)
+        n_total = X_all.shape[0]
+        
+        valid_mask = np.isfinite(X_all).all(axis=1) & (X_all != 0).any(axis=1)
+        valid_indices_full = np.flatnonzero(valid_mask)
+        X_valid = X_all[valid_mask]
+        n_valid = X_valid.shape[0]
+        
+        if n_valid == 0:
             return (
-                np.array([]).reshape(0, len(self.FEATURES)), 
+                np.array([]).reshape(0, n_features), 
                 [],
                 {
-                    'total_windows': len(metric_windows),
+                    'total_windows': n_total,
                     'selected_samples': 0,
                     'sample_rate_actual': 0.0,
                     'strategy': sampling_strategy
@@ -119,51 +160,17 @@ class FeatureExtractor:
             )
         
         # Apply sampling if needed
-        selected_indices = list(range(len(features_list)))
-        
-        if sample_rate is not None and 0 < sample_rate < 1.0:
-            n_select = max(1, int(len(features_list) * sample_rate))
-            
-            if sampling_strategy == 'uniform':
-                # Random sampling without replacement
-                selected_indices = sorted(
-                    np.random.choice(len(features_list), n_select, replace=False)
-                )
-            
-            elif sampling_strategy == 'stratified':
-                # Divide into chunks, sample proportionally from each
-                n_chunks = max(5, int(len(features_list) ** 0.5))
-                chunk_size = len(features_list) // n_chunks
-                selected_indices = []
-                
-                for chunk_idx in range(n_chunks):
-                    start = chunk_idx * chunk_size
-                    end = start + chunk_size if chunk_idx < n_chunks - 1 else len(features_list)
-                    chunk_samples = max(1, int((end - start) * sample_rate))
-                    
-                    chunk_indices = np.random.choice(
-                        list(range(start, end)),
-                        min(chunk_samples, end - start),
-                        replace=False
-                    )
-                    selected_indices.extend(chunk_indices)
-                
-                selected_indices = sorted(selected_indices[:n_select])
-            
-            elif sampling_strategy == 'systematic':
-                # Take every Nth sample
-                step = max(1, len(features_list) // n_select)
-                selected_indices = list(range(0, len(features_list), step))[:n_select]
+        selected_indices = self.select_sample_indices(n_valid, sample_rate, sampling_strategy)
         
         # Extract selected features and map back to original indices
-        X = np.array([features_list[i] for i in selected_indices])
-        valid_indices = [valid_indices_full[i] for i in selected_indices]
+        X = X_valid[selected_indices]
+        valid_indices = valid_indices_full[selected_indices].tolist()
         
-        actual_rate = len(selected_indices) / len(features_list) if features_list else 0.0
+        actual_rate = len(selected_indices) / n_valid
         
         stats = {
-            'total_windows': len(metric_windows),
-            'valid_samples_found': len(features_list),
+            'total_windows': n_total,
+            'valid_samples_found': n_valid,
             'selected_samples': len(selected_indices),
             'sample_rate_requested': sample_rate,
             'sample_rate_actual': actual_rate,
@@ -173,6 +180,45 @@ class FeatureExtractor:
         
         return X, valid_indices, stats
     
+    @staticmethod
+    def select_sample_indices(n: int, sample_rate: Optional[float],
+                              sampling_strategy: str = 'uniform',
+                              rng: Optional[np.random.Generator] = None) -> np.ndarray:
+        """
+        Choose which of n rows to keep, as a sorted index array.
+        
+        All rows are kept unless 0 < sample_rate < 1; see extract_batch for
+        the strategies.
+        """
+        if sample_rate is None or not 0 < sample_rate < 1.0:
+            return np.arange(n)
+        
+        rng = rng if rng is not None else np.random.default_rng()
+        n_select = max(1, int(n * sample_rate))
+        
+        if sampling_strategy == 'uniform':
+            # Random sampling without replacement
+            return np.sort(rng.choice(n, n_select, replace=False))
+        
+        if sampling_strategy == 'stratified':
+            # Divide into chunks, sample proportionally from each
+            n_chunks = max(5, int(n ** 0.5))
+            chunk_size = n // n_chunks
+            starts = np.arange(n_chunks) * chunk_size
+            ends = np.append(starts[1:], n)
+            picks = [
+                start + rng.choice(end - start, min(max(1, int((end - start) * sample_rate)), end - start), replace=False)
+                for start, end in zip(starts.tolist(), ends.tolist())
+            ]
+            return np.sort(np.concatenate(picks)[:n_select])
+        
+        if sampling_strategy == 'systematic':
+            # Take every Nth sample
+            step = max(1, n // n_select)
+            return np.arange(0, n, step)[:n_select]
+        
+        return np.arange(n)
+    
     def normalize(self, X: np.ndarray, fit: bool = False) -> np.ndarray:
         """Normalize features to zero mean and unit variance."""
         if fit:
@@ -45,6 +45,14 @@ class IsolationForestModel:
     that are few and different from the rest of the dataset.
     """
     
+    # sklearn's tree ensembles split on float32 thresholds and convert any other
+    # input dtype on every call; casting once up front avoids repeated copies
+    INPUT_DTYPE = np.float32
+    
+    # Anomaly probability below SEVERITY_BOUNDS[i] maps to SEVERITY_LABELS[i]
+    SEVERITY_BOUNDS = (0.5, 0.75)
+    SEVERITY_LABELS = ('low', 'medium', 'high')
+    
     def __init__(self, contamination: float = 0.1, n_estimators: int = 100,
                  random_state: int = 42, model_dir: str = 'backend/app/ml/models'):
         self.contamination = contamination
@@ -64,6 +72,7 @@ class IsolationForestModel:
         if X.shape[0] < 2:
             raise ValueError(f"Need at least 2 samples, got {X.shape[0]}")
         
+        X = np.asarray(X, dtype=self.INPUT_DTYPE)
         self.feature_names = feature_names
         self.model = IsolationForest(
             contamination=self.contamination,
@@ -103,6 +112,7 @@ class IsolationForestModel:
         if not self.is_trained or self.model is None:
             raise RuntimeError("Model must be trained before prediction")
         
+        X = np.asarray(X, dtype=self.INPUT_DTYPE)
         predictions = self.model.predict(X)
         scores = self.model.score_samples(X)
         
@@ -121,37 +131,31 @@ class IsolationForestModel:
                              ) -> List[Dict[str, Any]]:
         """Predict anomalies with human-readable insights."""
         predictions, scores, probs = self.predict(X)
-        results = []
         
-        for i, (pred, score, prob) in enumerate(zip(predictions, scores, probs)):
-            is_anomaly = pred == -1
-            severity = self._calculate_severity(prob)
-            
+        # Band and convert whole columns at once; only the result dicts are per row
+        severity_idx = np.searchsorted(self.SEVERITY_BOUNDS, probs, side='right')
+        severities = np.asarray(self.SEVERITY_LABELS)[severity_idx].tolist()
+        is_anomaly = (predictions == -1).tolist()
+        scores = scores.tolist()
+        probs = probs.tolist()
+        feature_names = self.feature_names or []
+        rows = np.asarray(X)[:, :len(feature_names)].tolist() if feature_names else None
+        
+        results = []
+        for i, severity in enumerate(severities):
             result = {
                 'index': data_indices[i] if data_indices else i,
-                'is_anomaly': bool(is_anomaly),
-                'anomaly_score': float(score),
-                'anomaly_probability': float(prob),
+                'is_anomaly': is_anomaly[i],
+                'anomaly_score': scores[i],
+                'anomaly_probability': probs[i],
                 'severity': severity,
-                'message': self._generate_message(is_anomaly, prob, severity),
-                'features': {
-                    name: float(X[i, j]) 
-                    for j, name in enumerate(self.feature_names or [])
-                }
+                'message': self._generate_message(is_anomaly[i], probs[i], severity),
+                'features': dict(zip(feature_names, rows[i])) if rows is not None else {}
             }
             results.append(result)
         
         return results
     
-    def _calculate_severity(self, probability: float) -> str:
-        """Determine severity from anomaly probability."""
-        if probability < 0.5:
-            return 'low'
-        elif probability < 0.75:
-            return 'medium'
-        else:
-            return 'high'
-    
     def _generate_message(self, is_anomaly: bool, prob: float, severity: str) -> str:
         """Generate human-readable message."""
         if not is_anomaly:
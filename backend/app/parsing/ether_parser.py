@@ -32,20 +32,24 @@ def parse_ethernet_frames(pcap_file: str):
             if 'ETH' in packet:
                 eth_layer = packet.eth
                 # normalize fields for downstream metric computation
-                src_ip = packet.ip.src if 'IP' in packet else None
-                dst_ip = packet.ip.dst if 'IP' in packet else None
+                # one layer lookup each; pyshark resolves layers by scanning the packet
+                ip_layer = getattr(packet, 'ip', None)
+                udp_layer = getattr(packet, 'udp', None)
+                tcp_layer = getattr(packet, 'tcp', None)
+                src_ip = ip_layer.src if ip_layer is not None else None
+                dst_ip = ip_layer.dst if ip_layer is not None else None
                 src_port = None
                 dst_port = None
-                if 'UDP' in packet:
+                if udp_layer is not None:
                     try:
-                        src_port = packet.udp.srcport
-                        dst_port = packet.udp.dstport
+                        src_port = udp_layer.srcport
+                        dst_port = udp_layer.dstport
                     except Exception:
                         pass
-                if 'TCP' in packet:
+                if tcp_layer is not None:
                     try:
-                        src_port = packet.tcp.srcport
-                        dst_port = packet.tcp.dstport
+                        src_port = tcp_layer.srcport
+                        dst_port = tcp_layer.dstport
                     except Exception:
                         pass
 
@@ -56,8 +60,9 @@ def parse_ethernet_frames(pcap_file: str):
                 except Exception:
                     try:
                         # fallback to layer-specific lengths
-                        if 'UDP' in packet and hasattr(packet.udp, 'length'):
-                            pkt_len = int(packet.udp.length)
+                        udp_length = getattr(udp_layer, 'length', None)
+                        if udp_length is not None:
+                            pkt_len = int(udp_length)
                     except Exception:
                         pkt_len = None
 
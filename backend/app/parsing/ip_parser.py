@@ -38,7 +38,7 @@ def parse_ip_packets(pcap_file: str):
                     'dst_ip': ip_layer.dst,
                     'protocol': ip_layer.proto,
                     'ip_version': ip_layer.version,
-                    'ttl': ip_layer.ttl if hasattr(ip_layer, 'ttl') else None,
+                    'ttl': getattr(ip_layer, 'ttl', None),
                 }
                 ip_packets.append(frame_info)
 